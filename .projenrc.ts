@@ -209,12 +209,21 @@ const eventhandlers = new PythonLambdaFunction({
         "requests",
         "urllib3",
     ],
+    devDeps: ["pytest-xdist"],
     outdir: "packages/eventhandlers",
     readme: {
         contents: "Lambda functions for handling events",
     },
 });
 
+// Test modules are independent, so run each file on its own worker
+eventhandlers.testTask.reset("pytest -n auto --dist=loadfile");
+eventhandlers
+    .tryFindObjectFile("pyproject.toml")
+    ?.addOverride("tool.pytest.ini_options.markers", [
+        "fast: unit tests with no AWS clients, selected with pytest -m fast",
+    ]);
+
 // CDK application for deployment
 const deploy = new CDKBlueprint({
     parent: project,
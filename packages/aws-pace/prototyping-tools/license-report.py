@@ -18,9 +18,13 @@ import argparse
 
 def find_file(dir_path, file_name, ignored_dirs=[]):
     """
-    Recursively searches for a given file name in a directory and its subdirectories,
+    Searches for a given file name in a directory and its subdirectories,
     ignoring the specified directories.
 
+    The tree is walked iteratively with os.scandir so that the entry type
+    reported by the directory listing is reused instead of stat-ing every
+    entry again.
+
     Args:
         dir_path (str): The directory path to search.
         file_name (str): The name of the file to search for.
@@ -31,21 +35,20 @@ def find_file(dir_path, file_name, ignored_dirs=[]):
     """
     found_files = []
 
-    # Check if the current directory should be ignored
+    # Check if the starting directory should be ignored
     if os.path.basename(dir_path) in ignored_dirs:
         return found_files
 
-    # Check if the file exists in the current directory
     safe_file_name = os.path.basename(file_name)
-    full_path = os.path.join(dir_path, safe_file_name)
-    if os.path.isfile(full_path):
-        found_files.append(full_path)
-
-    # Search in subdirectories
-    for item in os.listdir(dir_path):
-        item_path = os.path.join(dir_path, item)
-        if os.path.isdir(item_path):
-            found_files.extend(find_file(item_path, file_name, ignored_dirs))
+    stack = [dir_path]
+    while stack:
+        with os.scandir(stack.pop()) as entries:
+            for entry in entries:
+                if entry.is_dir(follow_symlinks=False):
+                    if entry.name not in ignored_dirs:
+                        stack.append(entry.path)
+                elif entry.name == safe_file_name and entry.is_file():
+                    found_files.append(entry.path)
 
     return found_files
 
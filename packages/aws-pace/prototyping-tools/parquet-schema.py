@@ -2,17 +2,22 @@
 """
 Parquet Schema Viewer
 
-This script downloads a parquet file from S3 and prints its schema information.
+This script reads a parquet file from S3 and prints its schema information.
 It can be used to quickly inspect the structure of parquet files without having
 to download and open them in a data analysis tool.
+
+Unless --output is given, the file is not downloaded: the footer and the first
+row group are fetched on demand with ranged GET requests.
 """
 
 import argparse
 import boto3
+import io
 import os
-import pandas as pd
 import sys
 import tempfile
+from functools import lru_cache
+from botocore.config import Config
 from botocore.exceptions import ClientError
 
 # Import pyarrow if available, otherwise provide guidance
@@ -25,6 +30,14 @@ except ImportError:
     sys.exit(1)
 
 
+@lru_cache(maxsize=None)
+def get_s3_client():
+    """Return a shared S3 client that keeps its connections alive between requests."""
+    return boto3.client(
+        "s3", config=Config(tcp_keepalive=True, max_pool_connections=50)
+    )
+
+
 def download_parquet_from_s3(bucket, key, local_path=None):
     """
     Download a parquet file from S3 to a local path.
@@ -37,7 +50,7 @@ def download_parquet_from_s3(bucket, key, local_path=None):
     Returns:
         str: Path to the downloaded file
     """
-    s3_client = boto3.client("s3")
+    s3_client = get_s3_client()
 
     # Use a temporary file if no local path is provided
     if not local_path:
@@ -53,16 +66,136 @@ def download_parquet_from_s3(bucket, key, local_path=None):
         raise
 
 
-def print_parquet_schema(file_path):
+class S3RangeReader(io.RawIOBase):
+    """
+    Read-only, seekable file object backed by ranged GET requests on an S3 object.
+
+    pyarrow only reads the byte ranges it needs (the footer, then the column
+    chunks of the row groups being scanned), so wrapping the object this way
+    avoids transferring the whole file to inspect it.
+    """
+
+    def __init__(self, bucket, key, s3_client=None):
+        """
+        Args:
+            bucket (str): S3 bucket name
+            key (str): S3 object key
+            s3_client (optional): boto3 S3 client. If None, the shared client is used.
+        """
+        super().__init__()
+        self.bucket = bucket
+        self.key = key
+        self.s3_client = s3_client or get_s3_client()
+        self.size = self.s3_client.head_object(Bucket=bucket, Key=key)["ContentLength"]
+        self.position = 0
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self.position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self.position + offset
+        elif whence == io.SEEK_END:
+            position = self.size + offset
+        else:
+            raise ValueError(f"Invalid whence: {whence}")
+        if position < 0:
+            raise ValueError(f"Negative seek position: {position}")
+        self.position = position
+        return self.position
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            end = self.size
+        else:
+            end = min(self.position + size, self.size)
+        if end <= self.position:
+            return b""
+
+        response = self.s3_client.get_object(
+            Bucket=self.bucket,
+            Key=self.key,
+            Range=f"bytes={self.position}-{end - 1}",
+        )
+        data = response["Body"].read()
+        self.position += len(data)
+        return data
+
+    def readall(self):
+        return self.read()
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[: len(data)] = data
+        return len(data)
+
+
+def collect_column_statistics(parquet_file):
+    """
+    Aggregate per-column statistics from the parquet row group metadata.
+
+    Parquet writers store min/max/null counts for every column chunk in the
+    file footer, so these can be reported without reading any data pages.
+
+    Args:
+        parquet_file (pq.ParquetFile): The opened parquet file
+
+    Returns:
+        dict: Column path mapped to a dict with "min", "max" and "null_count",
+        or to None if any row group is missing statistics for that column
+    """
+    metadata = parquet_file.metadata
+    column_stats = {}
+    for rg in range(metadata.num_row_groups):
+        row_group = metadata.row_group(rg)
+        for col in range(row_group.num_columns):
+            column = row_group.column(col)
+            path = column.path_in_schema
+            if path in column_stats and column_stats[path] is None:
+                continue
+
+            stats = column.statistics
+            if stats is None or not stats.has_null_count:
+                column_stats[path] = None
+                continue
+
+            # Row groups holding only nulls have a null count but no min/max
+            if not stats.has_min_max and stats.null_count != column.num_values:
+                column_stats[path] = None
+                continue
+
+            entry = column_stats.setdefault(
+                path, {"min": None, "max": None, "null_count": 0}
+            )
+            entry["null_count"] += stats.null_count
+            if stats.has_min_max:
+                if entry["min"] is None or stats.min < entry["min"]:
+                    entry["min"] = stats.min
+                if entry["max"] is None or stats.max > entry["max"]:
+                    entry["max"] = stats.max
+
+    return column_stats
+
+
+def print_parquet_schema(file_path, source=None):
     """
     Print the schema of a parquet file.
 
     Args:
-        file_path (str): Path to the parquet file
+        file_path (str): Path to the parquet file, also shown in the output
+        source (file-like, optional): Open file to read instead of file_path
     """
     try:
         # Read schema using pyarrow
-        parquet_file = pq.ParquetFile(file_path)
+        parquet_file = pq.ParquetFile(source if source is not None else file_path)
         schema = parquet_file.schema
 
         # Print basic file info
@@ -84,23 +217,38 @@ def print_parquet_schema(file_path):
         print("=" * 60)
         print(schema)
 
-        # Read and print data sample using pandas
+        # Read and print data sample from the first row group only
         print("\nData Sample (first 5 rows):")
         print("=" * 60)
-        df = pd.read_parquet(file_path)
-        print(df.head(5).to_string())
+        sample = None
+        if parquet_file.num_row_groups:
+            batches = parquet_file.iter_batches(batch_size=5, row_groups=[0])
+            sample = next(batches, None)
+        if sample is None:
+            print("(no rows)")
+        else:
+            print(sample.to_pandas().to_string())
 
-        # Print column statistics
+        # Print column statistics from the row group metadata
         print("\nColumn Statistics:")
         print("=" * 60)
-        for col in df.columns:
-            print(f"{col}:")
-            print(f"  Type: {df[col].dtype}")
-            if pd.api.types.is_numeric_dtype(df[col]):
-                print(f"  Min: {df[col].min()}")
-                print(f"  Max: {df[col].max()}")
-                print(f"  Mean: {df[col].mean()}")
-            print(f"  Null count: {df[col].isna().sum()}")
+        column_stats = collect_column_statistics(parquet_file)
+        for i in range(len(schema)):
+            column = schema.column(i)
+            stats = column_stats.get(column.path)
+            logical_type = column.logical_type
+            print(f"{column.path}:")
+            if logical_type.type != "NONE":
+                print(f"  Type: {logical_type}")
+            else:
+                print(f"  Type: {column.physical_type}")
+            if stats is None:
+                print("  Statistics: not available")
+            else:
+                if stats["min"] is not None:
+                    print(f"  Min: {stats['min']}")
+                    print(f"  Max: {stats['max']}")
+                print(f"  Null count: {stats['null_count']}")
             print()
 
     except Exception as e:
@@ -111,28 +259,35 @@ def print_parquet_schema(file_path):
 def main():
     """Main entry point for the script."""
     parser = argparse.ArgumentParser(
-        description="Download and print schema of a parquet file from S3"
+        description="Print schema of a parquet file from S3"
     )
     parser.add_argument("--bucket", required=True, help="S3 bucket name")
     parser.add_argument(
         "--key", required=True, help="S3 object key (path to parquet file)"
     )
-    parser.add_argument("--output", help="Local path to save the downloaded file")
+    parser.add_argument(
+        "--output",
+        help="Local path to save the downloaded file. If omitted, only the "
+        "byte ranges needed for the report are read from S3.",
+    )
 
     args = parser.parse_args()
 
-    # Download the file
-    local_file = download_parquet_from_s3(args.bucket, args.key, args.output)
+    if args.output:
+        # Download the whole file and read it locally
+        local_file = download_parquet_from_s3(args.bucket, args.key, args.output)
+        print_parquet_schema(local_file)
+        return
 
-    # Print the schema
-    print_parquet_schema(local_file)
+    # Read the footer and first row group directly from S3
+    try:
+        reader = S3RangeReader(args.bucket, args.key)
+    except ClientError as e:
+        print(f"Error opening file: {e}")
+        sys.exit(1)
 
-    # Clean up temporary file if we created one
-    if not args.output and local_file.startswith(tempfile.gettempdir()):
-        try:
-            os.remove(local_file)
-        except OSError as e:
-            print(f"Warning: Failed to remove temporary file {local_file}: {e}")
+    with reader:
+        print_parquet_schema(f"s3://{args.bucket}/{args.key}", source=reader)
 
 
 if __name__ == "__main__":
@@ -131,27 +131,16 @@ export class ChatLambdaFunctionsConstruct extends Construct {
             },
         );
 
-        this.chatbotHandlerRole.addToPolicy(
-            new cdk.aws_iam.PolicyStatement({
-                actions: ["cloudwatch:PutMetricData"],
-                resources: ["*"],
-                effect: cdk.aws_iam.Effect.ALLOW,
-                conditions: {
-                    StringEquals: {
-                        "cloudwatch:namespace": "AIGateway/TokenUsage",
-                    },
-                },
-            }),
-        );
-
         // Add permissions for DynamoDB token usage table
         this.chatbotHandlerRole.addToPolicy(
             new cdk.aws_iam.PolicyStatement({
                 actions: [
                     "dynamodb:GetItem",
+                    "dynamodb:BatchGetItem",
                     "dynamodb:PutItem",
                     "dynamodb:UpdateItem",
                     "dynamodb:DeleteItem",
+                    "dynamodb:ConditionCheckItem",
                     "dynamodb:Query",
                     "dynamodb:BatchWriteItem",
                 ],
@@ -166,6 +155,7 @@ export class ChatLambdaFunctionsConstruct extends Construct {
                 new cdk.aws_iam.PolicyStatement({
                     actions: [
                         "dynamodb:GetItem",
+                        "dynamodb:BatchGetItem",
                         "dynamodb:PutItem",
                         "dynamodb:UpdateItem",
                         "dynamodb:Query",
@@ -7,7 +7,6 @@ A command-line tool for managing the DynamoDB response cache table.
 
 import argparse
 import boto3
-import hashlib
 import json
 import os
 import sys
@@ -16,18 +15,39 @@ from typing import Dict, List, Optional, Any
 
 from eventhandlers.response_cache import ResponseCache
 
+# orjson parses and serializes much faster than the json module; use it when installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dump_json(data) -> bytes:
+    """Serialize data as indented JSON bytes with a trailing newline."""
+    if orjson is not None:
+        return orjson.dumps(
+            data, option=orjson.OPT_INDENT_2 | orjson.OPT_APPEND_NEWLINE
+        )
+    return (json.dumps(data, indent=2, ensure_ascii=False) + "\n").encode("utf-8")
+
+
+def load_json(data):
+    """Parse a JSON document from str or bytes."""
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
 
 def scan_command(args):
     """Scan the cache table and display entries."""
     cache = ResponseCache(table_name=args.table_name)
-    entries = cache.scan_cache(limit=args.limit)
-
-    if not entries:
-        print("No entries found in the cache.")
-        return
 
-    print(f"Found {len(entries)} entries in the cache:")
-    for i, entry in enumerate(entries, 1):
+    # Render entries as scan segments complete instead of waiting for all
+    entries = []
+    for i, entry in enumerate(
+        cache.iter_cache(limit=args.limit, segments=args.segments), 1
+    ):
+        entries.append(entry)
         print(f"\n--- Entry {i} ---")
         print(f"Prompt: {entry['prompt_text'][:100]}...")
         print(f"Response: {entry['response'][:100]}...")
@@ -39,10 +59,16 @@ def scan_command(args):
             )
             print(f"Expires: {ttl_date}")
 
+    if not entries:
+        print("No entries found in the cache.")
+        return
+
+    print(f"\nFound {len(entries)} entries in the cache.")
+
     if args.output:
         try:
-            with open(args.output, "w") as f:
-                json.dump(entries, f, indent=2)
+            with open(args.output, "wb") as f:
+                f.write(dump_json(entries))
             print(f"\nEntries saved to {args.output}")
         except (PermissionError, IOError) as e:
             print(f"Error writing output file: {e}")
@@ -52,6 +78,13 @@ def insert_command(args):
     """Insert or update an entry in the cache table."""
     cache = ResponseCache(table_name=args.table_name)
 
+    if args.input_jsonl:
+        if args.skip_existing:
+            print("Error: --skip-existing cannot be used with --input-jsonl.")
+            return
+        insert_jsonl(cache, args.input_jsonl)
+        return
+
     # Get prompt from file or argument
     prompt = args.prompt
     if args.prompt_file:
@@ -76,13 +109,42 @@ def insert_command(args):
         print("Error: Both prompt and response must be provided.")
         return
 
-    success = cache.cache_response(prompt, response)
-    if success:
+    success = cache.cache_response(prompt, response, overwrite=not args.skip_existing)
+    if success and args.skip_existing:
+        print(f"Entry is cached for prompt: {prompt[:50]}...")
+    elif success:
         print(f"Successfully added/updated entry for prompt: {prompt[:50]}...")
     else:
         print("Failed to add/update entry.")
 
 
+def insert_jsonl(cache, path):
+    """Insert entries from a JSON Lines file with "prompt" and "response" keys."""
+    entries = []
+    try:
+        with open(path, "rb") as f:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    entry = load_json(line)
+                    entries.append((entry["prompt"], entry["response"]))
+                except (json.JSONDecodeError, KeyError, TypeError) as e:
+                    print(f"Error parsing line {line_number}: {e}")
+                    return
+    except (FileNotFoundError, PermissionError, IOError) as e:
+        print(f"Error reading input file: {e}")
+        return
+
+    if not entries:
+        print("No entries found in the input file.")
+        return
+
+    written = cache.cache_responses(entries)
+    # Prompts with the same cache key share one entry
+    print(f"Successfully added/updated {written} entries from {len(entries)} lines.")
+
+
 def delete_command(args):
     """Delete an entry from the cache table."""
     cache = ResponseCache(table_name=args.table_name)
@@ -159,6 +221,12 @@ def main():
     scan_parser.add_argument(
         "--limit", type=int, default=100, help="Maximum number of entries to return"
     )
+    scan_parser.add_argument(
+        "--segments",
+        type=int,
+        default=8,
+        help="Number of parallel scan segments",
+    )
     scan_parser.add_argument("--output", help="Output file for JSON results")
 
     # Insert command
@@ -169,9 +237,18 @@ def main():
     insert_parser.add_argument(
         "--response-file", help="File containing the response text"
     )
+    insert_parser.add_argument(
+        "--input-jsonl",
+        help="JSON Lines file of entries with prompt and response keys to insert in bulk",
+    )
     insert_parser.add_argument(
         "--ttl-days", type=int, default=30, help="Time to live in days"
     )
+    insert_parser.add_argument(
+        "--skip-existing",
+        action="store_true",
+        help="Keep an unexpired entry for the prompt instead of replacing it",
+    )
 
     # Delete command
     delete_parser = subparsers.add_parser("delete", help="Delete an entry")
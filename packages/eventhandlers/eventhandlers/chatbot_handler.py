@@ -14,22 +14,28 @@ permissions and limitations under the License.
 """
 
 import json
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from functools import lru_cache
 from typing import Dict
 
 import boto3
 import requests
-import urllib3
 from aws_lambda_powertools import Logger
 from botocore.auth import SigV4Auth
 from botocore.awsrequest import AWSRequest
+from botocore.config import Config
+from pydantic import ValidationError
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import os
 
 from .token_meter import TokenLimiter
 from .auth import validate_channel_auth
 from .response_cache import ResponseCache
-from .messages import ConverseMessages, MessageTracker
-from .metrics import publish_token_metrics
+from .messages import ConverseMessages, MessageTracker, firehose_batcher
+from .metrics import flush_token_metrics, publish_token_metrics
 from .guardrails_integration import BedrockGuardrailsIntegration
 
 
@@ -37,15 +43,102 @@ from .guardrails_integration import BedrockGuardrailsIntegration
 logger = Logger(service="eventhandlers")
 
 # Initialize clients
-http = urllib3.PoolManager()
-bedrock = boto3.client("bedrock-runtime")
+# Reuse one HTTP session so publishes to AppSync share a kept-alive TLS connection
+http_session = requests.Session()
+http_session.mount(
+    "https://",
+    HTTPAdapter(
+        pool_connections=16,
+        pool_maxsize=64,
+        max_retries=Retry(total=2, backoff_factor=0.1),
+    ),
+)
+# Keep Bedrock connections alive between warm invocations and back off
+# client-side when the model is throttling
+bedrock = boto3.client(
+    "bedrock-runtime",
+    config=Config(
+        tcp_keepalive=True,
+        max_pool_connections=32,
+        retries={"mode": "adaptive", "max_attempts": 3},
+    ),
+)
 token_limiter = TokenLimiter()
 response_cache = ResponseCache()
 guardrails_integration = BedrockGuardrailsIntegration()
 
+# Runs token usage writes off the streaming path
+usage_executor = ThreadPoolExecutor(max_workers=2)
+USAGE_UPDATE_TIMEOUT_SECONDS = 5
+
+# Publishes batches to AppSync while the next stream events are read from
+# Bedrock; a single worker keeps the batches in order
+publish_executor = ThreadPoolExecutor(max_workers=1)
+
 session = boto3.Session()
 credentials = session.get_credentials()
 
+# Configuration from the environment, fixed for the lifetime of the container
+API_ENDPOINT = os.environ.get("APPSYNC_ENDPOINT_URL", "")
+if not API_ENDPOINT.startswith("https://"):
+    API_ENDPOINT = f"https://{API_ENDPOINT}/event"
+RESPONSE_CHANNEL = os.environ.get("RESPONSE_CHANNEL", "Outbound-Messages")
+REGION = os.environ.get("AWS_REGION", "us-east-1")
+DEFAULT_MODEL_ID = os.environ.get(
+    "DEFAULT_MODEL_ID", "us.anthropic.claude-opus-4-1-20250805-v1:0"
+)
+TOKEN_LIMIT = int(os.environ.get("TOKEN_LIMIT", 8000))
+# Prompts containing the trigger raise a simulated error, for testing the error
+# handling end to end. Only checked when enabled for the deployment.
+ERROR_SIMULATION_ENABLED = (
+    os.environ.get("ENABLE_ERROR_SIMULATION", "false").lower() == "true"
+)
+ERROR_SIMULATION_TRIGGER = ":::simulate-errors:::"
+# Meter limits are fixed by the meter configuration
+METER_LIMITS = token_limiter.get_meter_limits()
+
+# Compact JSON encoder for events and publish bodies. The default json encoder
+# already runs in C; dropping the separator whitespace shrinks every payload.
+encode_json = json.JSONEncoder(separators=(",", ":")).encode
+
+# AppSync Events accepts at most 5 events per publish request
+MAX_EVENTS_PER_PUBLISH = 5
+# Minimum spacing between publishes, and so the longest a stream event waits
+# to be batched with later events
+PUBLISH_INTERVAL_SECONDS = 0.05
+
+
+class CachedSigV4Auth(SigV4Auth):
+    """
+    SigV4Auth that reuses the derived signing key between requests.
+
+    The signing key only depends on the secret key, date, region and service,
+    so it is derived once per day instead of with four HMACs per request.
+    """
+
+    def __init__(self, credentials, service_name, region_name):
+        super().__init__(credentials, service_name, region_name)
+        # (secret key, date) the key was derived for, and the derived key
+        self._cached_signing_key = (None, None)
+
+    def signature(self, string_to_sign, request):
+        key = self.credentials.secret_key
+        scope = (key, request.context["timestamp"][0:8])
+        cached_scope, k_signing = self._cached_signing_key
+        if scope != cached_scope:
+            k_date = self._sign(f"AWS4{key}".encode(), scope[1])
+            k_region = self._sign(k_date, self._region_name)
+            k_service = self._sign(k_region, self._service_name)
+            k_signing = self._sign(k_service, "aws4_request")
+            self._cached_signing_key = (scope, k_signing)
+        return self._sign(k_signing, string_to_sign, hex=True)
+
+
+@lru_cache(maxsize=None)
+def get_appsync_signer(region):
+    """Return the shared AppSync request signer for a region."""
+    return CachedSigV4Auth(credentials, "appsync", region)
+
 
 def send_iam_signed_request(url, method="POST", body=None, region=None):
     """
@@ -60,26 +153,24 @@ def send_iam_signed_request(url, method="POST", body=None, region=None):
     Returns:
         Response from the endpoint
     """
+    # Encode the body once; the signer hashes and the session sends these bytes
+    data = encode_json(body).encode("utf-8") if body else None
+
     # Create the request
-    request = AWSRequest(
-        method=method, url=url, data=json.dumps(body) if body else None
-    )
+    request = AWSRequest(method=method, url=url, data=data)
 
     # Add necessary headers
     request.headers["Content-Type"] = "application/json"
 
     # Sign the request with SigV4
-    SigV4Auth(credentials, "appsync", region).add_auth(request)
-
-    # Convert AWSRequest to a regular request
-    prepared_request = request.prepare()
-
-    # Send the request
-    response = requests.request(
-        method=prepared_request.method,
-        url=prepared_request.url,
-        headers=dict(prepared_request.headers),
-        data=prepared_request.body,
+    get_appsync_signer(region).add_auth(request)
+
+    # Send the signed request as is; the URL has no query parameters to prepare
+    response = http_session.request(
+        method=method,
+        url=url,
+        headers=dict(request.headers),
+        data=data,
     )
 
     return response
@@ -107,6 +198,174 @@ def publish_to_channel(payload, api_endpoint, region):
     return response
 
 
+class ChannelEventBatcher:
+    """
+    Buffers events for a channel and publishes them in batches.
+
+    Each publish is a separately signed HTTPS request, so stream events are
+    grouped into a single request. A batch is published when it reaches the
+    AppSync limit of events per request, when the publish interval has elapsed
+    since the previous publish, or when flush is called. Events added within
+    the interval are published by a timer once it ends, so they do not wait
+    for the next stream event.
+
+    Batches are published in the background so reading the stream is not held
+    up by the request; call wait before anything else is sent to the channel.
+    """
+
+    def __init__(self, channel: str, api_endpoint: str, region: str):
+        self.channel = channel
+        self.api_endpoint = api_endpoint
+        self.region = region
+        self.pending_events = []
+        self.last_publish = 0.0
+        self.publishes = []
+        # The timer flushes from its own thread
+        self.lock = threading.Lock()
+        self.timer = None
+
+    def add(self, event: dict, flush: bool = False):
+        """
+        Add an event to the batch, publishing the batch if it is due.
+
+        Args:
+            event: The event to publish
+            flush: Publish the batch immediately after adding the event
+        """
+        data = encode_json(event)
+        with self.lock:
+            self.pending_events.append(data)
+            remaining = self.last_publish + PUBLISH_INTERVAL_SECONDS - time.monotonic()
+            due = (
+                flush
+                or len(self.pending_events) >= MAX_EVENTS_PER_PUBLISH
+                or remaining <= 0
+            )
+            if not due and self.timer is None:
+                self.timer = threading.Timer(remaining, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Publish any buffered events."""
+        with self.lock:
+            if self.timer is not None:
+                self.timer.cancel()
+                self.timer = None
+            if not self.pending_events:
+                return
+            payload = {"channel": self.channel, "events": self.pending_events}
+            self.pending_events = []
+            self.last_publish = time.monotonic()
+            self.publishes.append(
+                publish_executor.submit(
+                    publish_to_channel, payload, self.api_endpoint, self.region
+                )
+            )
+
+    def wait(self):
+        """
+        Wait for every submitted batch to be published.
+
+        Raises:
+            Exception: The first error raised while publishing a batch
+        """
+        with self.lock:
+            publishes, self.publishes = self.publishes, []
+        for publish in publishes:
+            publish.result()
+
+
+# Error type and message sent to the frontend for each Bedrock error code
+BEDROCK_ERRORS = {
+    "ValidationException": (
+        "bedrock_validation_error",
+        "Invalid request parameters for AI model",
+    ),
+    "ThrottlingException": (
+        "bedrock_throttling_error",
+        "AI model is currently busy. Please try again in a moment",
+    ),
+    "AccessDeniedException": (
+        "bedrock_access_denied",
+        "Access denied to AI model",
+    ),
+    "ModelNotReadyException": (
+        "bedrock_model_not_ready",
+        "AI model is not ready. Please try again later",
+    ),
+}
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estimate the number of tokens in a text without a tokenizer.
+
+    Uses the common approximation of four characters per token, which only
+    needs the string length instead of splitting the text into words.
+
+    Args:
+        text: The text to estimate
+
+    Returns:
+        The estimated token count
+    """
+    return len(text) // 4
+
+
+def conversation_start_event(conversation_id: str) -> dict:
+    """
+    Build the event that precedes a response and identifies its conversation.
+
+    The events of the response that follow it do not repeat the conversation ID.
+
+    Args:
+        conversation_id: The conversation ID from the request
+
+    Returns:
+        The conversationStart event
+    """
+    return {"conversationStart": {"conversationId": conversation_id}}
+
+
+def build_token_usage(
+    token_usage: Dict[str, int], input_tokens: int, output_tokens: int
+) -> Dict:
+    """
+    Build the token usage data attached to metadata events.
+
+    The usage stored in DynamoDB may not include the current response yet,
+    so the current response's tokens are added to every total.
+
+    Args:
+        token_usage: Token usage read from DynamoDB before the request
+        input_tokens: Input tokens used by the current response
+        output_tokens: Output tokens used by the current response
+
+    Returns:
+        Token limit, meter limits, current usage and total usage
+    """
+    return {
+        "tokenLimit": TOKEN_LIMIT,
+        "meterLimits": METER_LIMITS,  # Include all meter limits
+        "currentUsage": {
+            "inputTokens": input_tokens,
+            "outputTokens": output_tokens,
+            "totalTokens": input_tokens + output_tokens,
+        },
+        "totalUsage": {
+            "inputTokens": token_usage["input_tokens"] + input_tokens,
+            "outputTokens": token_usage["output_tokens"] + output_tokens,
+            "dailyInputTokens": token_usage["daily_input_tokens"] + input_tokens,
+            "dailyOutputTokens": token_usage["daily_output_tokens"] + output_tokens,
+            "monthlyInputTokens": token_usage["monthly_input_tokens"] + input_tokens,
+            "monthlyOutputTokens": token_usage["monthly_output_tokens"] + output_tokens,
+        },
+    }
+
+
 def send_error_event(
     error_type: str,
     message: str,
@@ -148,7 +407,7 @@ def send_error_event(
 
     payload = {
         "channel": f"/{response_channel}/{path}",
-        "events": [json.dumps(error_event)],
+        "events": [encode_json(error_event)],
     }
 
     logger.error(
@@ -164,6 +423,21 @@ def send_error_event(
     publish_to_channel(payload, api_endpoint, region)
 
 
+def is_json_parse_error(error: Exception) -> bool:
+    """
+    Check whether model_validate_json failed because the payload is not valid JSON.
+
+    Args:
+        error: The exception raised while handling an event
+
+    Returns:
+        True if the payload could not be parsed as JSON
+    """
+    return isinstance(error, ValidationError) and any(
+        detail["type"] == "json_invalid" for detail in error.errors()
+    )
+
+
 def lambda_handler(event, context):
     """
     Lambda handler for processing chat events from AppSync Events API
@@ -183,19 +457,15 @@ def lambda_handler(event, context):
     sub = None
     path = None
 
-    # Get environment variables
-    api_endpoint = os.environ.get("APPSYNC_ENDPOINT_URL", "")
-    if not api_endpoint.startswith("https://"):
-        api_endpoint = f"https://{api_endpoint}/event"
-    response_channel = os.environ.get("RESPONSE_CHANNEL", "Outbound-Messages")
-    region = os.environ.get("AWS_REGION", "us-east-1")
-    default_model_id = os.environ.get(
-        "DEFAULT_MODEL_ID", "us.anthropic.claude-opus-4-1-20250805-v1:0"
-    )
+    # Configuration resolved at cold start
+    api_endpoint = API_ENDPOINT
+    response_channel = RESPONSE_CHANNEL
+    region = REGION
+    default_model_id = DEFAULT_MODEL_ID
 
     try:
         # Validate channel authorization
-        is_authorized, sub, path = validate_channel_auth(event)
+        is_authorized, sub, path, _ = validate_channel_auth(event)
         if not is_authorized:
             return
 
@@ -221,14 +491,15 @@ def lambda_handler(event, context):
             }
             payload = {
                 "channel": f"/{response_channel}/{path}",
-                "events": [json.dumps(limit_event)],
+                "events": [encode_json(limit_event)],
             }
             publish_to_channel(payload, api_endpoint, region)
             return
 
         # Create a reservation to prevent race conditions
         # This reserves 50% of daily output limit to prevent concurrent requests from exceeding limits
-        reservation_id = token_limiter.create_reservation(sub)
+        # Reuse the usage read above rather than querying the meters again
+        reservation_id = token_limiter.create_reservation(sub, token_usage)
         if reservation_id is None:
             # Could not create reservation - likely would exceed limits
             limit_message = "Request denied to prevent exceeding daily output token limits due to concurrent usage."
@@ -264,10 +535,9 @@ def lambda_handler(event, context):
 
             # Parse the payload as a ConverseMessages structure
             try:
-                # Parse the JSON string into a list of message dicts
-                # Validate and convert to ConverseMessages model using model_validate
-                converse_messages = ConverseMessages.model_validate(
-                    json.loads(item.get("payload"))
+                # Parse and validate the JSON string in a single pass
+                converse_messages = ConverseMessages.model_validate_json(
+                    item.get("payload")
                 )
                 process_message(
                     converse_messages,
@@ -280,18 +550,20 @@ def lambda_handler(event, context):
                     reservation_id,
                     context.aws_request_id,
                 )
-            except json.JSONDecodeError as e:
-                send_error_event(
-                    error_type="json_parse_error",
-                    message="Invalid JSON format in request payload",
-                    request_id=context.aws_request_id,
-                    path=path,
-                    api_endpoint=api_endpoint,
-                    response_channel=response_channel,
-                    region=region,
-                    details={"parse_error": str(e)},
-                )
             except Exception as e:
+                if is_json_parse_error(e):
+                    send_error_event(
+                        error_type="json_parse_error",
+                        message="Invalid JSON format in request payload",
+                        request_id=context.aws_request_id,
+                        path=path,
+                        api_endpoint=api_endpoint,
+                        response_channel=response_channel,
+                        region=region,
+                        details={"parse_error": str(e)},
+                    )
+                    continue
+
                 send_error_event(
                     error_type="validation_error",
                     message="Failed to validate request payload",
@@ -329,6 +601,12 @@ def lambda_handler(event, context):
             )
 
     finally:
+        # Send the conversation logs and metrics buffered during this
+        # invocation, as the execution environment may be frozen once the
+        # handler returns
+        firehose_batcher.flush()
+        flush_token_metrics()
+
         # Always clean up the reservation when the request completes, regardless of success or failure
         if reservation_id:
             success = token_limiter.remove_reservation(sub, reservation_id)
@@ -380,11 +658,10 @@ def process_message(
     """
     # Start timing for latency measurement
     start_time = time.time()
-    # Extract messages from the ConverseMessages model
-    messages = converse_messages.model_dump()
+    channel = f"/{response_channel}/{path}"
 
     # Use the model ID from the request or fall back to the default
-    model_id = messages.get("modelId") or default_model_id
+    model_id = converse_messages.modelId or default_model_id
 
     # Get guardrail info for logging
     guardrail_info = guardrails_integration.get_guardrail_info()
@@ -395,34 +672,30 @@ def process_message(
     )
 
     # Extract conversation ID
-    conversation_id = messages.get("conversationId")
+    conversation_id = converse_messages.conversationId
     logger.info(
         "Processing conversation",
         extra={"conversation_id": conversation_id or "unknown", **guardrail_info},
     )
 
     # Extract user ID from path
-    path_segments = path.split("/")
-    if not path_segments or not path_segments[0]:
+    user_id = path.partition("/")[0]
+    if not user_id:
         logger.error("Invalid path format", extra={"path": path})
         return
-    user_id = path_segments[0]
 
-    # Extract the most recent user message
-    user_messages = [
-        msg for msg in messages.get("messages", []) if msg.get("role") == "user"
-    ]
+    # Extract the most recent user message, scanning back from the newest turn
     most_recent_user_message = ""
-    if user_messages:
-        # Get the content from the most recent user message
-        content = user_messages[-1].get("content", [])
-        if content and isinstance(content, list):
-            most_recent_user_message = " ".join(
-                [item.get("text", "") for item in content]
-            )
+    for msg in reversed(converse_messages.messages):
+        if msg.role == "user":
+            most_recent_user_message = " ".join([item.text for item in msg.content])
+            break
 
     # Check for error simulation trigger
-    if ":::simulate-errors:::" in most_recent_user_message:
+    if (
+        ERROR_SIMULATION_ENABLED
+        and ERROR_SIMULATION_TRIGGER in most_recent_user_message
+    ):
         logger.info(
             "Simulating error for testing purposes",
             extra={
@@ -451,33 +724,18 @@ def process_message(
                     "contentBlockDelta": {"delta": {"text": cached_response}}
                 }
 
-                # Add conversation ID to the event if available
-                if conversation_id:
-                    content_event["conversationId"] = conversation_id
-
-                # Publish the cached response
-                payload = {
-                    "channel": f"/{response_channel}/{path}",
-                    "events": [json.dumps(content_event)],
-                }
-
-                logger.info("Found cache for prompt")
-                publish_to_channel(payload, api_endpoint, region)
-
                 # Send a messageStop event to signal completion
                 message_stop_event = {"messageStop": True}
 
-                # Add conversation ID to the event if available
+                # Publish the cached response and the completion event together
+                events = [encode_json(content_event), encode_json(message_stop_event)]
                 if conversation_id:
-                    message_stop_event["conversationId"] = conversation_id
+                    events.insert(
+                        0, encode_json(conversation_start_event(conversation_id))
+                    )
+                payload = {"channel": channel, "events": events}
 
-                # Publish the messageStop event
-                payload = {
-                    "channel": f"/{response_channel}/{path}",
-                    "events": [json.dumps(message_stop_event)],
-                }
-
-                logger.info("Sending completion event for cached response")
+                logger.info("Found cache for prompt")
                 publish_to_channel(payload, api_endpoint, region)
 
                 # Calculate latency for cached response
@@ -486,13 +744,10 @@ def process_message(
                 # Publish metrics for cached response
                 # For cached responses, we don't have token counts, so we use estimates
                 # based on the length of the response and prompt
-                estimated_input_tokens = len(most_recent_user_message.split()) // 3
-                estimated_output_tokens = len(cached_response.split()) // 3
-
                 publish_token_metrics(
                     model_id=model_id,
-                    input_tokens=estimated_input_tokens,
-                    output_tokens=estimated_output_tokens,
+                    input_tokens=estimate_tokens(most_recent_user_message),
+                    output_tokens=estimate_tokens(cached_response),
                     latency=latency_ms,
                     is_cached=True,
                 )
@@ -523,6 +778,8 @@ def process_message(
             # Continue with normal processing if cache check fails
             cached_response = None
 
+    batcher = None
+    usage_update = None
     try:
         # Create message tracker
         tracker = MessageTracker(
@@ -535,7 +792,8 @@ def process_message(
         # Prepare request parameters for Bedrock
         request_params = {
             "modelId": model_id,
-            "messages": messages.get("messages"),
+            # Serialize all messages in a single call into pydantic-core
+            "messages": converse_messages.model_dump(include={"messages"})["messages"],
             "inferenceConfig": {"maxTokens": 512, "temperature": 0.5, "topP": 0.9},
         }
 
@@ -547,20 +805,30 @@ def process_message(
         # Call Bedrock with guardrails applied
         response = bedrock.converse_stream(**request_params)
 
-        logger.info(
-            "Publishing to channel", extra={"channel": f"/{response_channel}/{path}"}
-        )
+        logger.info("Publishing to channel", extra={"channel": channel})
+        batcher = ChannelEventBatcher(channel, api_endpoint, region)
+
+        # Identify the conversation once rather than on every stream event
+        if conversation_id:
+            batcher.add(conversation_start_event(conversation_id))
 
         for stream_event in response.get("stream", []):
             # Let the tracker process the event and update its state
             is_metadata = tracker.process_stream_event(stream_event)
 
             # If this was a metadata event, update token usage in the database
+            # in the background so the final events are not held up by the write
             if is_metadata:
-                token_limiter.update_usage(
-                    user_id, tracker.input_tokens, tracker.output_tokens
+                usage_update = usage_executor.submit(
+                    token_limiter.update_usage,
+                    user_id,
+                    tracker.input_tokens,
+                    tracker.output_tokens,
                 )
 
+                # Send the conversation log while the final events publish
+                firehose_batcher.flush(wait=False)
+
                 # Calculate latency for the response
                 latency_ms = (time.time() - start_time) * 1000
 
@@ -573,77 +841,38 @@ def process_message(
                     is_cached=False,
                 )
 
-            # Add conversation ID to the stream event if available
-            if conversation_id:
-                stream_event["conversationId"] = conversation_id
-
             # Add token limit and usage data to metadata events
             if "metadata" in stream_event and "usage" in stream_event["metadata"]:
-                # Get token limit from environment variable or use default
-                token_limit = int(os.environ.get("TOKEN_LIMIT", 8000))
-
                 # Get current usage from the event
                 current_usage = stream_event["metadata"]["usage"]
-                input_tokens = current_usage.get("inputTokens", 0)
-                output_tokens = current_usage.get("outputTokens", 0)
-
-                # Get meter limits from the token limiter
-                meter_limits = token_limiter.get_meter_limits()
-
-                # Combine with the token usage from DynamoDB
-                # We add the current usage to the DynamoDB values since they might not be updated yet
-                combined_usage = {
-                    "tokenLimit": token_limit,
-                    "meterLimits": meter_limits,  # Include all meter limits
-                    "currentUsage": {
-                        "inputTokens": input_tokens,
-                        "outputTokens": output_tokens,
-                        "totalTokens": input_tokens + output_tokens,
-                    },
-                    "totalUsage": {
-                        "inputTokens": token_usage["input_tokens"] + input_tokens,
-                        "outputTokens": token_usage["output_tokens"] + output_tokens,
-                        "dailyInputTokens": token_usage["daily_input_tokens"]
-                        + input_tokens,
-                        "dailyOutputTokens": token_usage["daily_output_tokens"]
-                        + output_tokens,
-                        "monthlyInputTokens": token_usage["monthly_input_tokens"]
-                        + input_tokens,
-                        "monthlyOutputTokens": token_usage["monthly_output_tokens"]
-                        + output_tokens,
-                    },
-                }
+                combined_usage = build_token_usage(
+                    token_usage,
+                    current_usage.get("inputTokens", 0),
+                    current_usage.get("outputTokens", 0),
+                )
 
                 # Add the combined usage data to the event
                 stream_event["tokenUsage"] = combined_usage
 
-            payload = {
-                "channel": f"/{response_channel}/{path}",
-                "events": [json.dumps(stream_event)],
-            }
+            # Publish usage updates straight away; deltas may wait to be batched
+            batcher.add(stream_event, flush=is_metadata)
 
-            publish_to_channel(payload, api_endpoint, region)
+        batcher.flush()
+        batcher.wait()
 
     except Exception as e:
         # Handle Bedrock API errors and other processing errors
-        error_message = "Failed to generate response from AI model"
         error_details = {"error": str(e)}
 
-        # Check for specific error types
-        if "ValidationException" in str(e):
-            error_message = "Invalid request parameters for AI model"
-            error_type = "bedrock_validation_error"
-        elif "ThrottlingException" in str(e):
-            error_message = "AI model is currently busy. Please try again in a moment"
-            error_type = "bedrock_throttling_error"
-        elif "AccessDeniedException" in str(e):
-            error_message = "Access denied to AI model"
-            error_type = "bedrock_access_denied"
-        elif "ModelNotReadyException" in str(e):
-            error_message = "AI model is not ready. Please try again later"
-            error_type = "bedrock_model_not_ready"
-        else:
-            error_type = "bedrock_api_error"
+        # Classify by the error code; errors raised mid-stream use a
+        # lowerCamelCase code such as "throttlingException"
+        # Not only ClientError has a response; requests sets it to None
+        error_response = getattr(e, "response", None) or {}
+        error_code = error_response.get("Error", {}).get("Code", "")
+        error_type, error_message = BEDROCK_ERRORS.get(
+            error_code[:1].upper() + error_code[1:],
+            ("bedrock_api_error", "Failed to generate response from AI model"),
+        )
 
         logger.error(
             "Error in message processing",
@@ -658,6 +887,14 @@ def process_message(
             },
         )
 
+        # Send any buffered events before the error event
+        if batcher is not None:
+            batcher.flush()
+            try:
+                batcher.wait()
+            except Exception as publish_error:
+                logger.error(f"Error publishing buffered events: {publish_error}")
+
         # Send error event to frontend
         send_error_event(
             error_type=error_type,
@@ -672,6 +909,30 @@ def process_message(
         )
 
     finally:
+        # Record usage before releasing the reservation that stood in for it,
+        # and before the invocation ends and the container may be frozen
+        if usage_update is not None:
+            done, _ = wait([usage_update], timeout=USAGE_UPDATE_TIMEOUT_SECONDS)
+            if not done:
+                logger.warning(
+                    "Timed out waiting for token usage update",
+                    extra={"user_id": user_id, "request_id": request_id},
+                )
+            elif usage_update.exception() is not None:
+                logger.error(
+                    "Error updating token usage",
+                    extra={
+                        "error": str(usage_update.exception()),
+                        "user_id": user_id,
+                        "request_id": request_id,
+                    },
+                )
+            elif not usage_update.result():
+                logger.error(
+                    "Failed to update token usage",
+                    extra={"user_id": user_id, "request_id": request_id},
+                )
+
         # Always clean up the reservation when the request completes
         if reservation_id:
             success = token_limiter.remove_reservation(user_id, reservation_id)
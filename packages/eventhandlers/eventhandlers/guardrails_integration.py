@@ -33,6 +33,17 @@ class BedrockGuardrailsIntegration:
             "BEDROCK_GUARDRAIL_VERSION", "1"
         )
 
+        # Both are fixed for the lifetime of the integration, so build them once
+        self._guardrail_config = {
+            "guardrailIdentifier": self.guardrail_id,
+            "guardrailVersion": self.guardrail_version,
+            "streamProcessingMode": "sync",
+        }
+        self._guardrail_info = {
+            "guardrail_id": self.guardrail_id,
+            "guardrail_version": self.guardrail_version,
+        }
+
         if self.guardrail_id:
             logger.info(
                 "Guardrails integration initialized",
@@ -65,11 +76,7 @@ class BedrockGuardrailsIntegration:
             return request_params
 
         # Add guardrails configuration to the request
-        request_params["guardrailConfig"] = {
-            "guardrailIdentifier": self.guardrail_id,
-            "guardrailVersion": self.guardrail_version,
-            "streamProcessingMode": "sync",
-        }
+        request_params["guardrailConfig"] = self._guardrail_config
 
         logger.info(
             "Applied guardrails to Bedrock request",
@@ -86,9 +93,7 @@ class BedrockGuardrailsIntegration:
         Get guardrail information for logging
 
         Returns:
-            Dictionary with guardrail ID and version
+            Dictionary with guardrail ID and version, shared between calls and
+            not to be modified
         """
-        return {
-            "guardrail_id": self.guardrail_id,
-            "guardrail_version": self.guardrail_version,
-        }
+        return self._guardrail_info
@@ -13,18 +13,218 @@ express or implied. See the License for the specific language governing
 permissions and limitations under the License.
 """
 
+import atexit
 import boto3
 import json
 import datetime
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from typing import Dict, List, Literal
 
 from aws_lambda_powertools import Logger
+from botocore.config import Config
 
 import os
 from pydantic import BaseModel, Field
 
 logger = Logger(service="messages")
-firehose = boto3.client("firehose")
+
+# orjson serializes much faster than the json module; use it when installed
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+@lru_cache(maxsize=None)
+def get_firehose_client():
+    """
+    Return the shared Firehose client, creating it on first use.
+
+    The connection is kept alive between warm invocations, and throttled
+    calls are retried with adaptive backoff.
+    """
+    return boto3.client(
+        "firehose",
+        config=Config(
+            tcp_keepalive=True, retries={"mode": "adaptive", "max_attempts": 3}
+        ),
+    )
+
+
+# Delivery stream for conversation logs, resolved at cold start; when unset,
+# nothing is sent and the Firehose client is never created
+FIREHOSE_DELIVERY_STREAM = os.environ.get("FIREHOSE_DELIVERY_STREAM")
+
+# PutRecordBatch limits
+FIREHOSE_BATCH_MAX_RECORDS = 500
+FIREHOSE_BATCH_MAX_BYTES = 4_000_000
+FIREHOSE_BATCH_MAX_AGE_SECONDS = 1.0
+FIREHOSE_MAX_ATTEMPTS = 3
+# Delay before records are sent again, doubled for each later attempt; the
+# usual cause of a failure is throttling, which does not clear immediately
+FIREHOSE_RETRY_DELAY_SECONDS = 0.1
+
+# Sends batches off the request path; a single worker keeps them in order
+firehose_executor = ThreadPoolExecutor(max_workers=1)
+
+
+# Compact separators, as orjson uses; the output is ASCII as non-ASCII
+# characters are escaped
+_encode_json = json.JSONEncoder(separators=(",", ":")).encode
+
+
+def encode_record(data: Dict) -> bytes:
+    """Serialize a record as a line of JSON bytes."""
+    if orjson is not None:
+        return orjson.dumps(data, option=orjson.OPT_APPEND_NEWLINE)
+    return _encode_json(data).encode("ascii") + b"\n"
+
+
+class FirehoseRecordBatcher:
+    """
+    Buffers records for a Firehose delivery stream and sends them with PutRecordBatch.
+
+    A batch is sent when it reaches the record or size limit of a PutRecordBatch
+    call, when the oldest buffered record is older than the maximum age, or when
+    flush is called. Records that were not written, because Firehose rejected
+    them or the call failed, are sent again after a backoff delay.
+
+    Batches that become due as records are added are sent in the background,
+    so logging does not hold up the response stream.
+    """
+
+    def __init__(self, firehose_client=None):
+        self.firehose_client = firehose_client
+        self.pending_records = deque()
+        self.pending_bytes = 0
+        self.oldest_record = 0.0
+        self.sends = []
+
+    def add(self, delivery_stream: str, data: bytes):
+        """
+        Buffer a record, sending the buffered records if a batch is due.
+
+        Args:
+            delivery_stream: Name of the Firehose delivery stream
+            data: The record data
+        """
+        if not self.pending_records:
+            self.oldest_record = time.monotonic()
+        self.pending_records.append((delivery_stream, data, 1))
+        self.pending_bytes += len(data)
+        if (
+            len(self.pending_records) >= FIREHOSE_BATCH_MAX_RECORDS
+            or self.pending_bytes >= FIREHOSE_BATCH_MAX_BYTES
+            or time.monotonic() - self.oldest_record >= FIREHOSE_BATCH_MAX_AGE_SECONDS
+        ):
+            self.flush(wait=False)
+
+    def flush(self, wait: bool = True):
+        """
+        Send all buffered records.
+
+        Args:
+            wait: Send the records before returning. Otherwise they are sent
+                in the background; a later flush waits for them to be sent.
+        """
+        records, self.pending_records = self.pending_records, deque()
+        self.pending_bytes = 0
+        if not wait:
+            if records:
+                self.sends.append(firehose_executor.submit(self._send_records, records))
+            return
+
+        sends, self.sends = self.sends, []
+        for send in sends:
+            send.result()
+        self._send_records(records)
+
+    def _send_records(self, records: deque):
+        """Send records in as few PutRecordBatch calls as the limits allow."""
+        while records:
+            delivery_stream = records[0][0]
+            batch = []
+            batch_bytes = 0
+            while (
+                records
+                and records[0][0] == delivery_stream
+                and len(batch) < FIREHOSE_BATCH_MAX_RECORDS
+                and batch_bytes + len(records[0][1]) <= FIREHOSE_BATCH_MAX_BYTES
+            ):
+                record = records.popleft()
+                batch.append(record)
+                batch_bytes += len(record[1])
+            if not batch:
+                # A single record over the size limit; Firehose will reject it
+                batch.append(records.popleft())
+            attempts = max(record[2] for record in batch)
+            if attempts > 1:
+                time.sleep(FIREHOSE_RETRY_DELAY_SECONDS * 2 ** (attempts - 2))
+            self._send_batch(delivery_stream, batch, records)
+
+    def _send_batch(self, delivery_stream: str, batch: List, records: deque):
+        """Send one batch, requeueing the records Firehose failed to write."""
+        try:
+            firehose = self.firehose_client or get_firehose_client()
+            response = firehose.put_record_batch(
+                DeliveryStreamName=delivery_stream,
+                Records=[{"Data": data} for _, data, _ in batch],
+            )
+        except Exception as e:
+            logger.error(f"Failed to send data to Firehose: {str(e)}")
+            for record in batch:
+                self._retry_record(record, records, str(e))
+            return
+
+        if not response.get("FailedPutCount"):
+            logger.debug(
+                f"Successfully sent {len(batch)} records to Firehose stream: {delivery_stream}"
+            )
+            return
+
+        # Responses are in the same order as the records in the request
+        failed = 0
+        for record, result in zip(batch, response["RequestResponses"]):
+            if "ErrorCode" not in result:
+                continue
+            failed += 1
+            self._retry_record(record, records, result.get("ErrorMessage"))
+        logger.warning(f"Firehose rejected {failed} of {len(batch)} records")
+
+    @staticmethod
+    def _retry_record(record, records: deque, error: str):
+        """Requeue a record that was not written, unless out of attempts."""
+        stream, data, attempts = record
+        if attempts < FIREHOSE_MAX_ATTEMPTS:
+            records.append((stream, data, attempts + 1))
+        else:
+            logger.error(f"Failed to send record to Firehose: {error}")
+
+
+firehose_batcher = FirehoseRecordBatcher()
+
+# Send any buffered records before the execution environment shuts down
+atexit.register(firehose_batcher.flush)
+
+
+def preview(text: str, length: int = 100) -> str:
+    """
+    Get the start of a text for logging.
+
+    Args:
+        text: The text to preview
+        length: Maximum number of characters to include
+
+    Returns:
+        The text itself if it fits, otherwise its first characters with "..."
+        appended
+    """
+    if len(text) <= length:
+        return text
+    return text[:length] + "..."
 
 
 class MessageTracker:
@@ -39,39 +239,78 @@ class MessageTracker:
         self.user_id = user_id
         self.conversation_id = conversation_id
         self.user_message = user_message
-        self.assistant_response = ""
+        # Response text is collected as a list of deltas and only joined when
+        # needed, as repeatedly extending a string copies it on every delta
+        self.response_chunks = []
+        self.response_length = 0
         self.input_tokens = 0
         self.output_tokens = 0
         self.metadata_processed = False
         self.model_id = model_id
 
+    @property
+    def assistant_response(self) -> str:
+        """The assistant response received so far."""
+        return "".join(self.response_chunks)
+
+    def response_preview(self, length: int = 100) -> str:
+        """
+        Get the start of the assistant response without joining all of it.
+
+        Args:
+            length: Maximum number of characters to include
+
+        Returns:
+            The first characters of the response, with "..." appended if it
+            was truncated
+        """
+        if self.response_length <= length:
+            return self.assistant_response
+
+        chunks = []
+        collected = 0
+        for chunk in self.response_chunks:
+            chunks.append(chunk)
+            collected += len(chunk)
+            if collected >= length:
+                break
+        return "".join(chunks)[:length] + "..."
+
     def process_stream_event(self, stream_event: Dict) -> bool:
         """
         Process a stream event, updating internal state as needed.
         Returns True if this was a metadata event that was processed.
         """
-        # Check if this is a metadata event with token usage
-        if (
-            "metadata" in stream_event
-            and "usage" in stream_event["metadata"]
-            and not self.metadata_processed
-        ):
-            self.metadata_processed = True
-            usage = stream_event["metadata"]["usage"]
-            self.input_tokens = usage.get("inputTokens", 0)
-            self.output_tokens = usage.get("outputTokens", 0)
+        # Each stream event has a single top-level key naming its type
+        handler = self.STREAM_EVENT_HANDLERS.get(next(iter(stream_event), None))
+        return handler(self, stream_event) if handler else False
 
-            # Log completion since metadata is the last meaningful event
-            self.log_completion()
-            return True
+    def _process_content_block_delta(self, stream_event: Dict) -> bool:
+        """Track assistant response from a content block delta."""
+        text = stream_event["contentBlockDelta"].get("delta", {}).get("text")
+        if text is not None:
+            self.response_chunks.append(text)
+            self.response_length += len(text)
+        return False
 
-        # Track assistant response from content block deltas
-        if "contentBlockDelta" in stream_event:
-            delta = stream_event["contentBlockDelta"].get("delta", {})
-            if "text" in delta:
-                self.assistant_response += delta["text"]
+    def _process_metadata(self, stream_event: Dict) -> bool:
+        """Record token usage from the metadata event and log completion."""
+        usage = stream_event["metadata"].get("usage")
+        if usage is None or self.metadata_processed:
+            return False
 
-        return False
+        self.metadata_processed = True
+        self.input_tokens = usage.get("inputTokens", 0)
+        self.output_tokens = usage.get("outputTokens", 0)
+
+        # Log completion since metadata is the last meaningful event
+        self.log_completion()
+        return True
+
+    STREAM_EVENT_HANDLERS = {
+        "contentBlockDelta": _process_content_block_delta,
+        "metadata": _process_metadata,
+    }
 
     def log_completion(self):
         """Log complete information about the conversation turn"""
@@ -85,33 +324,19 @@ class MessageTracker:
             "model_id": self.model_id,
             "input_tokens": self.input_tokens,
             "output_tokens": self.output_tokens,
-            "user_message": self.user_message[:100]
-            + ("..." if len(self.user_message) > 100 else ""),
-            "assistant_response_length": len(self.assistant_response),
-            "assistant_response_preview": self.assistant_response[:100]
-            + ("..." if len(self.assistant_response) > 100 else ""),
-            "timestamp": now.strftime("%Y-%m-%d %H:%M:%S"),
-            "year": now.strftime("%Y"),
-            "month": now.strftime("%m"),
-            "day": now.strftime("%d"),
+            "user_message": preview(self.user_message),
+            "assistant_response_length": self.response_length,
+            "assistant_response_preview": self.response_preview(),
+            # Firehose derives the year/month/day S3 partitions itself
+            "timestamp": now.isoformat(sep=" ", timespec="seconds"),
         }
 
         # Log to CloudWatch
         logger.info("Message complete", extra=log_data)
 
         # Send to Firehose if configured
-        firehose_stream = os.environ.get("FIREHOSE_DELIVERY_STREAM")
-        if firehose_stream:
-            try:
-                firehose.put_record(
-                    DeliveryStreamName=firehose_stream,
-                    Record={"Data": json.dumps(log_data) + "\n"},
-                )
-                logger.debug(
-                    f"Successfully sent data to Firehose stream: {firehose_stream}"
-                )
-            except Exception as e:
-                logger.error(f"Failed to send data to Firehose: {str(e)}")
+        if FIREHOSE_DELIVERY_STREAM:
+            firehose_batcher.add(FIREHOSE_DELIVERY_STREAM, encode_record(log_data))
 
 
 # Pydantic models for Bedrock Converse Message format
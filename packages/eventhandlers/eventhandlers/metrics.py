@@ -13,19 +13,25 @@ express or implied. See the License for the specific language governing
 permissions and limitations under the License.
 """
 
-import boto3
-from typing import List, Optional
-from aws_lambda_powertools import Logger
+import logging
+from typing import Optional
+from aws_lambda_powertools import Logger, Metrics
+from aws_lambda_powertools.metrics import MetricUnit
 
 # Configure structured logging with Powertools
 logger = Logger(service="metrics")
 
-# Initialize CloudWatch client
-cloudwatch = boto3.client("cloudwatch")
-
 # Define CloudWatch metric namespace
 METRIC_NAMESPACE = "AIGateway/TokenUsage"
 
+# Metrics are written to the function log in CloudWatch Embedded Metric Format,
+# which CloudWatch ingests without an API call from the function
+metrics = Metrics(namespace=METRIC_NAMESPACE)
+
+# Model ID dimension of the metrics added since the last flush. Metrics for the
+# same model are collected into one EMF record, which holds every value added.
+pending_model_id = None
+
 
 def publish_token_metrics(
     model_id: str,
@@ -37,6 +43,9 @@ def publish_token_metrics(
     """
     Publish token usage metrics to CloudWatch
 
+    The metrics are written when flush_token_metrics is called, or when
+    metrics for a different model are published.
+
     Args:
         model_id: The model ID used for the request
         input_tokens: Number of input tokens
@@ -44,67 +53,70 @@ def publish_token_metrics(
         latency: Response latency in milliseconds (if available)
         is_cached: Whether the response was from cache
     """
+    global pending_model_id
     total_tokens = input_tokens + output_tokens
 
-    # Prepare metric data
-    metric_data = [
-        {
-            "MetricName": "InputTokens",
-            "Dimensions": [{"Name": "ModelId", "Value": model_id}],
-            "Value": input_tokens,
-            "Unit": "Count",
-        },
-        {
-            "MetricName": "OutputTokens",
-            "Dimensions": [{"Name": "ModelId", "Value": model_id}],
-            "Value": output_tokens,
-            "Unit": "Count",
-        },
-        {
-            "MetricName": "TotalTokens",
-            "Dimensions": [{"Name": "ModelId", "Value": model_id}],
-            "Value": total_tokens,
-            "Unit": "Count",
-        },
-    ]
-
-    # Add cached response metric if applicable
-    if is_cached:
-        metric_data.append(
-            {
-                "MetricName": "CachedResponses",
-                "Dimensions": [{"Name": "ModelId", "Value": model_id}],
-                "Value": 1,
-                "Unit": "Count",
-            }
+    # Each EMF record has a single set of dimensions
+    if pending_model_id != model_id:
+        flush_token_metrics()
+
+    try:
+        if pending_model_id is None:
+            metrics.add_dimension(name="ModelId", value=model_id)
+            pending_model_id = model_id
+        metrics.add_metric(
+            name="InputTokens", unit=MetricUnit.Count, value=input_tokens
+        )
+        metrics.add_metric(
+            name="OutputTokens", unit=MetricUnit.Count, value=output_tokens
+        )
+        metrics.add_metric(
+            name="TotalTokens", unit=MetricUnit.Count, value=total_tokens
         )
 
-    # Add latency metric if provided
-    if latency is not None:
-        metric_data.append(
-            {
-                "MetricName": "ResponseLatency",
-                "Dimensions": [{"Name": "ModelId", "Value": model_id}],
-                "Value": latency,
-                "Unit": "Milliseconds",
-            }
+        # Add cached response metric if applicable
+        if is_cached:
+            metrics.add_metric(name="CachedResponses", unit=MetricUnit.Count, value=1)
+
+        # Add latency metric if provided
+        if latency is not None:
+            metrics.add_metric(
+                name="ResponseLatency", unit=MetricUnit.Milliseconds, value=latency
+            )
+
+        # Skip building the record when debug logging is off
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "Published token metrics to CloudWatch",
+                extra={
+                    "model_id": model_id,
+                    "input_tokens": input_tokens,
+                    "output_tokens": output_tokens,
+                    "total_tokens": total_tokens,
+                    "is_cached": is_cached,
+                    "latency": latency,
+                },
+            )
+    except Exception as e:
+        # Don't carry partially added metrics over into the next publish
+        metrics.clear_metrics()
+        pending_model_id = None
+        logger.error(
+            "Failed to publish token metrics to CloudWatch", extra={"error": str(e)}
         )
 
+
+def flush_token_metrics():
+    """Write the metrics published since the last flush as an EMF log record."""
+    global pending_model_id
+    if pending_model_id is None:
+        return
+
+    pending_model_id = None
     try:
-        # Publish metrics to CloudWatch
-        cloudwatch.put_metric_data(Namespace=METRIC_NAMESPACE, MetricData=metric_data)
-        logger.debug(
-            "Published token metrics to CloudWatch",
-            extra={
-                "model_id": model_id,
-                "input_tokens": input_tokens,
-                "output_tokens": output_tokens,
-                "total_tokens": total_tokens,
-                "is_cached": is_cached,
-                "latency": latency,
-            },
-        )
+        metrics.flush_metrics()
     except Exception as e:
+        metrics.clear_metrics()
         logger.error(
             "Failed to publish token metrics to CloudWatch", extra={"error": str(e)}
         )
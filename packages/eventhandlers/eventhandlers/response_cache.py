@@ -15,16 +15,73 @@ permissions and limitations under the License.
 
 import hashlib
 import json
+import threading
 import time
 import boto3
 import os
-from typing import Dict, List, Optional, Any
+from botocore.config import Config
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
 
 from aws_lambda_powertools import Logger
 
 # Configure structured logging with Powertools
 logger = Logger(service="eventhandlers")
 
+# BatchWriteItem accepts at most 25 put/delete requests per call
+BATCH_WRITE_MAX_ITEMS = 25
+BATCH_WRITE_MAX_ATTEMPTS = 5
+
+# Trailing characters ignored when matching prompts against the cache
+TRAILING_PUNCTUATION = " .?!"
+
+# Connections kept open by the shared client, enough for one per scan segment
+MAX_POOL_CONNECTIONS = 32
+
+# Responses kept in memory by each ResponseCache, so prompts repeated within a
+# warm execution environment skip DynamoDB. Entries expire quickly so that
+# changes made to the table are picked up.
+LOCAL_CACHE_MAX_ENTRIES = 1024
+LOCAL_CACHE_TTL_SECONDS = 300
+
+# Constructor for the prompt hash, looked up once rather than on every call
+_sha256 = hashlib.sha256
+
+
+@lru_cache(maxsize=None)
+def get_dynamodb_client():
+    """
+    Return a DynamoDB client shared by all ResponseCache instances.
+
+    TCP keepalive stops idle connections being dropped between warm
+    invocations, so the first lookup after a gap does not reconnect.
+    """
+    return boto3.client(
+        "dynamodb",
+        config=Config(
+            tcp_keepalive=True,
+            retries={"mode": "adaptive", "max_attempts": 3},
+            max_pool_connections=MAX_POOL_CONNECTIONS,
+        ),
+    )
+
+
+class ScanBudget:
+    """Number of entries a scan may still return, shared by its segments."""
+
+    def __init__(self, limit: int):
+        self.remaining = limit
+        self.lock = threading.Lock()
+
+    def take(self, count: int) -> int:
+        """Take up to count entries from the budget, returning how many were taken."""
+        with self.lock:
+            taken = min(count, self.remaining)
+            self.remaining -= taken
+            return taken
+
 
 class ResponseCache:
     """
@@ -39,53 +96,122 @@ class ResponseCache:
             dynamodb_client: Optional boto3 DynamoDB client
             table_name: Optional DynamoDB table name (defaults to env var RESPONSE_CACHE_TABLE)
         """
-        self.dynamodb = dynamodb_client or boto3.client("dynamodb")
+        self.dynamodb = dynamodb_client or get_dynamodb_client()
         self.table_name = table_name or os.environ.get("RESPONSE_CACHE_TABLE")
         if not self.table_name:
             raise ValueError("RESPONSE_CACHE_TABLE environment variable must be set")
         self.ttl_days = 30  # Cache responses for 30 days by default
+        self.local_cache = OrderedDict()
 
     def _hash_prompt(self, prompt: str) -> str:
         """
         Create a hash of the prompt to use as the partition key.
 
+        The hash is the stored partition key of every cached entry, so it
+        must stay SHA-256 for existing entries to remain reachable. hashlib
+        uses OpenSSL, which takes the SHA extensions on CPUs that have them.
+
         Args:
             prompt: The user prompt to hash
 
         Returns:
             A SHA-256 hash of the prompt as a hexadecimal string
         """
-        return hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        return _sha256(prompt.encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _normalize_prompt(prompt: str) -> str:
+        """
+        Normalize a prompt so that trivially different prompts share an entry.
+
+        Case, runs of whitespace and trailing punctuation are ignored.
+
+        Args:
+            prompt: The user prompt to normalize
+
+        Returns:
+            The normalized prompt, or the prompt itself if nothing is left
+        """
+        return (
+            " ".join(prompt.casefold().split()).rstrip(TRAILING_PUNCTUATION) or prompt
+        )
+
+    def _cache_key(self, prompt: str) -> str:
+        """
+        Get the partition key a prompt's response is cached under.
+
+        Args:
+            prompt: The user prompt
+
+        Returns:
+            The hash of the normalized prompt
+        """
+        return self._hash_prompt(self._normalize_prompt(prompt))
 
     def get_cached_response(self, prompt: str) -> Optional[str]:
         """
         Check if a response exists in the cache for this prompt.
 
+        Responses found recently are returned from memory. Otherwise the
+        entry for the normalized prompt is looked up together with an entry
+        keyed by the exact prompt, which is how entries were stored before
+        prompts were normalized.
+
         Args:
             prompt: The user prompt to check
 
         Returns:
             The cached response as a string, or None if not found
         """
-        prompt_hash = self._hash_prompt(prompt)
+        normalized_prompt = self._normalize_prompt(prompt)
+        prompt_hash = self._hash_prompt(normalized_prompt)
+
+        cached = self._recall(prompt_hash)
+        if cached is not None:
+            return cached, prompt_hash
+
+        # Prompts that are already normalized only need to be hashed once
+        keys = [{"prompt_hash": {"S": prompt_hash}}]
+        exact_hash = prompt_hash
+        if normalized_prompt != prompt:
+            exact_hash = self._hash_prompt(prompt)
+            keys.append({"prompt_hash": {"S": exact_hash}})
 
         try:
-            response = self.dynamodb.get_item(
-                TableName=self.table_name, Key={"prompt_hash": {"S": prompt_hash}}
+            # Only fetch the attributes needed to verify and return a hit
+            response = self.dynamodb.batch_get_item(
+                RequestItems={
+                    self.table_name: {
+                        "Keys": keys,
+                        "ProjectionExpression": "prompt_hash, prompt_text, #r",
+                        "ExpressionAttributeNames": {"#r": "response"},
+                    }
+                }
             )
+            items = {
+                item["prompt_hash"]["S"]: item
+                for item in response.get("Responses", {}).get(self.table_name, [])
+            }
 
-            item = response.get("Item")
-            if not item:
-                return None, prompt_hash
-
-            # Verify the prompt text matches exactly (in case of hash collision)
-            stored_prompt = item.get("prompt_text", {}).get("S")
+            # Verify the prompt text matches (in case of hash collision)
+            cached = None
+            item = items.get(prompt_hash)
+            if item:
+                stored_prompt = item.get("prompt_text", {}).get("S", "")
+                if self._normalize_prompt(stored_prompt) == normalized_prompt:
+                    cached = item.get("response", {}).get("S")
 
-            if stored_prompt == prompt:
-                # Return the cached response as a string
-                return item.get("response", {}).get("S"), prompt_hash
+            item = items.get(exact_hash)
+            if (
+                cached is None
+                and item
+                and item.get("prompt_text", {}).get("S") == prompt
+            ):
+                cached = item.get("response", {}).get("S")
 
-            return None, prompt_hash
+            if cached is not None:
+                self._remember(prompt_hash, cached)
+            return cached, prompt_hash
         except Exception as e:
             logger.error(
                 "Error retrieving cached response",
@@ -93,59 +219,262 @@ class ResponseCache:
             )
             return None, prompt_hash
 
-    def cache_response(self, prompt: str, response: str) -> bool:
+    def _remember(self, prompt_hash: str, response: str):
+        """Keep a response in the local cache, evicting the least recently used."""
+        self.local_cache[prompt_hash] = (
+            response,
+            time.monotonic() + LOCAL_CACHE_TTL_SECONDS,
+        )
+        self.local_cache.move_to_end(prompt_hash)
+        if len(self.local_cache) > LOCAL_CACHE_MAX_ENTRIES:
+            self.local_cache.popitem(last=False)
+
+    def _recall(self, prompt_hash: str) -> Optional[str]:
+        """Get an unexpired response from the local cache."""
+        entry = self.local_cache.get(prompt_hash)
+        if entry is None:
+            return None
+        response, expires = entry
+        if expires <= time.monotonic():
+            del self.local_cache[prompt_hash]
+            return None
+        self.local_cache.move_to_end(prompt_hash)
+        return response
+
+    def _build_item(self, prompt: str, response: str, ttl: int) -> Dict[str, Any]:
+        """
+        Build the DynamoDB item stored for a cached prompt/response pair.
+
+        Args:
+            prompt: The user prompt
+            response: The response as a string
+            ttl: Expiry time as a Unix timestamp
+
+        Returns:
+            The item in DynamoDB attribute value format
+        """
+        return {
+            "prompt_hash": {"S": self._cache_key(prompt)},
+            "prompt_text": {"S": prompt},
+            "response": {"S": response},
+            "ttl": {"N": str(ttl)},
+        }
+
+    def cache_response(
+        self, prompt: str, response: str, overwrite: bool = True
+    ) -> bool:
         """
         Cache a response for a prompt.
 
         Args:
             prompt: The user prompt
             response: The response as a string
+            overwrite: Replace an unexpired entry for the prompt. If False, the
+                write is conditional and an existing entry is kept.
 
         Returns:
-            True if the response was cached successfully, False otherwise
+            True if the response was cached successfully, or an existing entry
+            was kept, False otherwise
         """
-        prompt_hash = self._hash_prompt(prompt)
+        prompt_hash = self._cache_key(prompt)
 
         try:
             # Calculate TTL (30 days from now)
-            ttl = int(time.time()) + (self.ttl_days * 24 * 60 * 60)
-
-            self.dynamodb.put_item(
-                TableName=self.table_name,
-                Item={
-                    "prompt_hash": {"S": prompt_hash},
-                    "prompt_text": {"S": prompt},
-                    "response": {"S": response},
-                    "ttl": {"N": str(ttl)},
-                },
-            )
+            now = int(time.time())
+            ttl = now + (self.ttl_days * 24 * 60 * 60)
+
+            params = {
+                "TableName": self.table_name,
+                "Item": self._build_item(prompt, response, ttl),
+            }
+            if not overwrite:
+                # Evaluated by DynamoDB, so only one concurrent writer succeeds;
+                # expired entries may not have been deleted yet
+                params["ConditionExpression"] = (
+                    "attribute_not_exists(prompt_hash) OR #t < :now"
+                )
+                params["ExpressionAttributeNames"] = {"#t": "ttl"}
+                params["ExpressionAttributeValues"] = {":now": {"N": str(now)}}
+
+            self.dynamodb.put_item(**params)
+            self._remember(prompt_hash, response)
             return True
         except Exception as e:
+            error_response = getattr(e, "response", None) or {}
+            error_code = error_response.get("Error", {}).get("Code")
+            if error_code == "ConditionalCheckFailedException":
+                logger.debug(
+                    "Kept existing cache entry", extra={"prompt_hash": prompt_hash}
+                )
+                return True
             logger.error(
                 "Error caching response",
                 extra={"error": str(e), "prompt_hash": prompt_hash},
             )
             return False
 
-    def scan_cache(self, limit=100) -> List[Dict]:
+    def cache_responses(self, entries: Iterable[Tuple[str, str]]) -> int:
+        """
+        Cache many prompt/response pairs using BatchWriteItem.
+
+        Items are written in batches of up to 25, the BatchWriteItem maximum.
+        DynamoDB rejects a batch whose keys repeat, so prompts with the same
+        cache key are merged within a batch and the last response wins.
+        Unprocessed items returned by DynamoDB are retried with exponential
+        backoff.
+
+        Args:
+            entries: Iterable of (prompt, response) pairs
+
+        Returns:
+            The number of items that were written successfully
+        """
+        ttl = int(time.time()) + (self.ttl_days * 24 * 60 * 60)
+        written = 0
+        batch = {}
+
+        for prompt, response in entries:
+            item = self._build_item(prompt, response, ttl)
+            batch[item["prompt_hash"]["S"]] = {"PutRequest": {"Item": item}}
+            if len(batch) == BATCH_WRITE_MAX_ITEMS:
+                written += self._write_batch(list(batch.values()))
+                batch = {}
+
+        if batch:
+            written += self._write_batch(list(batch.values()))
+
+        return written
+
+    def _write_batch(self, requests: List[Dict[str, Any]]) -> int:
+        """
+        Write a single batch of put requests, retrying unprocessed items.
+
+        Args:
+            requests: Up to 25 BatchWriteItem put requests
+
+        Returns:
+            The number of items that were written
+        """
+        pending = requests
+        for attempt in range(BATCH_WRITE_MAX_ATTEMPTS):
+            if attempt:
+                time.sleep(0.05 * 2**attempt)
+            try:
+                response = self.dynamodb.batch_write_item(
+                    RequestItems={self.table_name: pending}
+                )
+            except Exception as e:
+                logger.error(
+                    "Error batch caching responses",
+                    extra={"error": str(e), "batch_size": len(pending)},
+                )
+                break
+
+            pending = response.get("UnprocessedItems", {}).get(self.table_name, [])
+            if not pending:
+                break
+
+        if pending:
+            logger.error(
+                "Failed to cache some responses",
+                extra={"unprocessed_count": len(pending)},
+            )
+        return len(requests) - len(pending)
+
+    def scan_cache(self, limit=100, segments=1) -> List[Dict]:
         """Scan the cache table and return all entries."""
-        try:
-            response = self.dynamodb.scan(TableName=self.table_name, Limit=limit)
-
-            items = response.get("Items", [])
-            result = []
-
-            for item in items:
-                result.append(
-                    {
-                        "prompt_hash": item.get("prompt_hash", {}).get("S", ""),
-                        "prompt_text": item.get("prompt_text", {}).get("S", ""),
-                        "response": item.get("response", {}).get("S", ""),
-                        "ttl": item.get("ttl", {}).get("N", ""),
-                    }
+        return list(self.iter_cache(limit=limit, segments=segments))
+
+    def iter_cache(self, limit=100, segments=1) -> Iterator[Dict]:
+        """
+        Scan the cache table, yielding entries as each scan segment completes.
+
+        With more than one segment, DynamoDB parallel scan is used: the table
+        is split into independent segments that are scanned concurrently.
+        Each segment is read page by page until the segments together have
+        returned the limit or the segment has been scanned completely, so
+        segments with few entries leave the rest of the limit to the others.
+
+        Args:
+            limit: Maximum number of entries to return
+            segments: Number of parallel scan segments
+
+        Yields:
+            Cache entries as dicts
+        """
+        segments = max(1, min(segments, limit))
+        budget = ScanBudget(limit)
+        # Pages of an even share of the limit, so the segments read in step
+        page_limit = -(-limit // segments)
+
+        with ThreadPoolExecutor(max_workers=segments) as executor:
+            futures = [
+                executor.submit(
+                    self._scan_segment, segment, segments, budget, page_limit
                 )
+                for segment in range(segments)
+            ]
+            for future in as_completed(futures):
+                try:
+                    items = future.result()
+                except Exception as e:
+                    print(f"Error scanning cache: {str(e)}")
+                    continue
 
-            return result
-        except Exception as e:
-            print(f"Error scanning cache: {str(e)}")
-            return []
+                for item in items:
+                    yield self._parse_item(item)
+
+    def _scan_segment(
+        self, segment: int, total_segments: int, budget: ScanBudget, page_limit: int
+    ) -> List:
+        """
+        Scan a single segment of the cache table, following pagination.
+
+        If a page fails, the entries read from earlier pages are still
+        returned, since they have already been counted against the budget.
+        """
+        params = {
+            "TableName": self.table_name,
+            "ProjectionExpression": "prompt_hash, prompt_text, #r, #t",
+            "ExpressionAttributeNames": {"#r": "response", "#t": "ttl"},
+        }
+        if total_segments > 1:
+            params["Segment"] = segment
+            params["TotalSegments"] = total_segments
+
+        items = []
+        while True:
+            # Read once, as other segments take from the budget concurrently
+            remaining = budget.remaining
+            if remaining <= 0:
+                break
+            try:
+                response = self.dynamodb.scan(
+                    Limit=min(page_limit, remaining), **params
+                )
+            except Exception as e:
+                logger.error(
+                    "Error scanning cache segment",
+                    extra={
+                        "error": str(e),
+                        "segment": segment,
+                        "items_read": len(items),
+                    },
+                )
+                break
+            page = response.get("Items", [])
+            items.extend(page[: budget.take(len(page))])
+            if "LastEvaluatedKey" not in response:
+                break
+            params["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+        return items
+
+    @staticmethod
+    def _parse_item(item: Dict[str, Any]) -> Dict[str, str]:
+        """Convert a DynamoDB item into a cache entry dict."""
+        return {
+            "prompt_hash": item.get("prompt_hash", {}).get("S", ""),
+            "prompt_text": item.get("prompt_text", {}).get("S", ""),
+            "response": item.get("response", {}).get("S", ""),
+            "ttl": item.get("ttl", {}).get("N", ""),
+        }
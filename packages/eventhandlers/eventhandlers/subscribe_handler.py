@@ -39,7 +39,7 @@ def lambda_handler(event, context):
     logger.set_correlation_id(context.aws_request_id)
 
     # Validate channel authorization
-    _, _, _, error_message = validate_channel_auth(event, return_error_message=True)
+    error_message = validate_channel_auth(event).error_message
 
     # https://docs.aws.amazon.com/appsync/latest/eventapi/writing-event-handlers.html#direct-lambda-integration
     # type LambdaAppSyncEventResponse = {
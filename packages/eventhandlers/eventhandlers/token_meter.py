@@ -15,15 +15,69 @@ permissions and limitations under the License.
 
 import boto3
 import datetime
+import logging
 import os
+import threading
+import time
 import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
 from typing import Tuple, Dict, List, Optional, Callable, Union, Any
 
 from aws_lambda_powertools import Logger
+from botocore.config import Config
 
 # Configure structured logging with Powertools
 logger = Logger(service="eventhandlers")
 
+# Runs the DynamoDB calls of the meters concurrently, so a limit check or usage
+# update waits for the slowest call rather than the sum of them
+meter_executor = ThreadPoolExecutor(max_workers=4)
+
+# Usage read by each meter is kept in memory briefly, so the requests of an
+# active user do not all read the same counters from DynamoDB. Usage recorded
+# by this execution environment is added to the kept values; usage recorded
+# elsewhere shows up once they expire.
+USAGE_CACHE_TTL_SECONDS = float(os.environ.get("USAGE_CACHE_TTL_SECONDS", "2"))
+USAGE_CACHE_MAX_ENTRIES = 10000
+
+# Token limits, read once at cold start
+DAILY_INPUT_LIMIT = int(os.environ.get("DAILY_INPUT_LIMIT", 10000))
+DAILY_OUTPUT_LIMIT = int(os.environ.get("DAILY_OUTPUT_LIMIT", 20000))
+MONTHLY_INPUT_LIMIT = int(os.environ.get("MONTHLY_INPUT_LIMIT", 100000))
+MONTHLY_OUTPUT_LIMIT = int(os.environ.get("MONTHLY_OUTPUT_LIMIT", 200000))
+HOURLY_INPUT_LIMIT = int(os.environ.get("HOURLY_INPUT_LIMIT", 1000))
+HOURLY_OUTPUT_LIMIT = int(os.environ.get("HOURLY_OUTPUT_LIMIT", 2000))
+
+# Each request reserves 50% of the daily output token limit while it runs
+RESERVATION_AMOUNT = int(DAILY_OUTPUT_LIMIT * 0.5)
+RESERVATION_TTL_MINUTES = int(os.environ.get("RESERVATION_TTL_MINUTES", "10"))
+# Times a reservation is checked and attempted when concurrent requests of the
+# same user make reservations in between
+RESERVATION_ATTEMPTS = 3
+# Times the reservation counters are requested while DynamoDB leaves keys
+# unprocessed
+BATCH_GET_MAX_ATTEMPTS = 5
+
+
+@lru_cache(maxsize=None)
+def get_dynamodb_client():
+    """
+    Return a DynamoDB client shared by all meters and reservation managers.
+
+    Connections are kept alive between warm invocations, and throttled calls
+    are retried with adaptive backoff.
+    """
+    return boto3.client(
+        "dynamodb",
+        config=Config(
+            tcp_keepalive=True,
+            retries={"mode": "adaptive", "max_attempts": 5},
+            max_pool_connections=64,
+        ),
+    )
+
 
 def next_month_delta(dt: datetime.datetime) -> datetime.timedelta:
     """Calculate the delta to the end of next month."""
@@ -31,6 +85,21 @@ def next_month_delta(dt: datetime.datetime) -> datetime.timedelta:
     return next_month.replace(day=1) - dt
 
 
+def round_to_ten_minutes(dt: datetime.datetime) -> datetime.datetime:
+    """Round a time down to the start of its 10-minute window."""
+    return dt.replace(minute=dt.minute - dt.minute % 10, second=0, microsecond=0)
+
+
+def round_to_hour(dt: datetime.datetime) -> datetime.datetime:
+    """Round a time down to the start of its hour."""
+    return dt.replace(minute=0, second=0, microsecond=0)
+
+
+def round_to_month(dt: datetime.datetime) -> datetime.datetime:
+    """Round a time down to the start of its month."""
+    return dt.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
 def create_ten_minute_period(
     input_limit: Optional[int] = None, output_limit: Optional[int] = None
 ) -> Dict[str, Any]:
@@ -38,15 +107,12 @@ def create_ten_minute_period(
     return {
         "name": "10min",
         "description": "daily",
-        "id_format": lambda dt: f"10min:{dt.strftime('%Y-%m-%d:%H:%M')}",
-        "round_time": lambda dt: dt.replace(
-            minute=(dt.minute // 10) * 10, second=0, microsecond=0
-        ),
+        "id_format": "10min:%Y-%m-%d:%H:%M",
+        "round_time": round_to_ten_minutes,
         "ttl_delta": datetime.timedelta(days=1),
         "query_window": datetime.timedelta(days=1),
-        "input_limit": input_limit or int(os.environ.get("DAILY_INPUT_LIMIT", 10000)),
-        "output_limit": output_limit
-        or int(os.environ.get("DAILY_OUTPUT_LIMIT", 20000)),
+        "input_limit": input_limit or DAILY_INPUT_LIMIT,
+        "output_limit": output_limit or DAILY_OUTPUT_LIMIT,
         "prefix": "10min:",
         "aggregate": True,
     }
@@ -59,16 +125,12 @@ def create_monthly_period(
     return {
         "name": "monthly",
         "description": "monthly",
-        "id_format": lambda dt: f"monthly:{dt.strftime('%Y-%m')}",
-        "round_time": lambda dt: dt.replace(
-            day=1, hour=0, minute=0, second=0, microsecond=0
-        ),
+        "id_format": "monthly:%Y-%m",
+        "round_time": round_to_month,
         "ttl_delta": next_month_delta,
         "query_window": None,
-        "input_limit": input_limit
-        or int(os.environ.get("MONTHLY_INPUT_LIMIT", 100000)),
-        "output_limit": output_limit
-        or int(os.environ.get("MONTHLY_OUTPUT_LIMIT", 200000)),
+        "input_limit": input_limit or MONTHLY_INPUT_LIMIT,
+        "output_limit": output_limit or MONTHLY_OUTPUT_LIMIT,
         "prefix": "monthly:",
         "aggregate": False,
     }
@@ -81,13 +143,12 @@ def create_hourly_period(
     return {
         "name": "hourly",
         "description": "hourly",
-        "id_format": lambda dt: f"hourly:{dt.strftime('%Y-%m-%d:%H')}",
-        "round_time": lambda dt: dt.replace(minute=0, second=0, microsecond=0),
+        "id_format": "hourly:%Y-%m-%d:%H",
+        "round_time": round_to_hour,
         "ttl_delta": datetime.timedelta(days=1),
         "query_window": None,
-        "input_limit": input_limit or int(os.environ.get("HOURLY_INPUT_LIMIT", 1000)),
-        "output_limit": output_limit
-        or int(os.environ.get("HOURLY_OUTPUT_LIMIT", 2000)),
+        "input_limit": input_limit or HOURLY_INPUT_LIMIT,
+        "output_limit": output_limit or HOURLY_OUTPUT_LIMIT,
         "prefix": "hourly:",
         "aggregate": False,
     }
@@ -99,6 +160,13 @@ class TokenMeter:
     Each instance handles a single time period.
     """
 
+    # Parts of the usage update that are the same for every call
+    UPDATE_EXPRESSION = "ADD input_tokens :i, output_tokens :o SET last_request_id = :rid, #ts = if_not_exists(#ts, :ts), #ttl = :ttl"
+    UPDATE_CONDITION = (
+        "attribute_not_exists(last_request_id) OR last_request_id <> :rid"
+    )
+    UPDATE_ATTRIBUTE_NAMES = {"#ts": "timestamp", "#ttl": "ttl"}
+
     def __init__(
         self,
         period_config: Dict[str, Any],
@@ -115,7 +183,7 @@ class TokenMeter:
 
         The period_config dictionary should contain:
             - name: Name of the period (e.g., '10min', 'monthly')
-            - id_format: Function that takes a datetime and returns a period ID string
+            - id_format: strftime format that turns a datetime into a period ID
             - round_time: Function that takes a datetime and rounds it to the period boundary
             - ttl_delta: Timedelta or function that returns the TTL delta for this period
             - query_window: Timedelta for the query window, or None if not applicable
@@ -125,7 +193,7 @@ class TokenMeter:
             - aggregate: Boolean indicating if this period requires aggregation
             - description: Human-readable description of this period
         """
-        self.dynamodb = dynamodb_client or boto3.client("dynamodb")
+        self.dynamodb = dynamodb_client or get_dynamodb_client()
         self.table_name = table_name or os.environ.get(
             "TOKEN_USAGE_TABLE", "UserTokenUsage"
         )
@@ -150,17 +218,25 @@ class TokenMeter:
         self.period_config = period_config
         self.name = period_config["name"]
         self.description = period_config["description"]
+        self.id_format = period_config["id_format"]
+        self.round_time = period_config["round_time"]
+
+        # Reads and updates run on the meter executor's threads, so the usage
+        # cache is guarded by a lock
+        self.usage_cache = OrderedDict()
+        self.usage_cache_lock = threading.Lock()
 
     def is_limit_exceeded(
-        self, user_id: str
+        self, user_id: str, now: Optional[datetime.datetime] = None
     ) -> Tuple[bool, Optional[str], Dict[str, int]]:
         """
-        Check if the user has exceeded token limits for this time period.
+        Check if the user has exceeded token limits for this time period,
+        as of now (defaults to the current time).
         Returns a tuple (is_exceeded, token_type, usage) where:
         - token_type is 'input' or 'output'
         - usage is a dictionary with input_tokens and output_tokens
         """
-        usage = self._get_usage(user_id)
+        usage = self._get_usage(user_id, now or datetime.datetime.now())
 
         # Validate usage dictionary has required keys
         if "input_tokens" not in usage or "output_tokens" not in usage:
@@ -177,14 +253,53 @@ class TokenMeter:
 
         return False, None, usage
 
-    def _get_usage(self, user_id: str) -> Dict[str, int]:
+    def _get_usage(self, user_id: str, now: datetime.datetime) -> Dict[str, int]:
         """
-        Get token usage for this time period.
+        Get token usage for this time period, from the usage cache if it was
+        read recently.
+        """
+        with self.usage_cache_lock:
+            entry = self.usage_cache.get(user_id)
+            if entry is not None:
+                usage, expires = entry
+                if expires > time.monotonic():
+                    self.usage_cache.move_to_end(user_id)
+                    return dict(usage)
+                del self.usage_cache[user_id]
+
+        usage = self._read_usage(user_id, now)
+        if usage is None:
+            # Read errors count as no usage, but are not cached
+            return {"input_tokens": 0, "output_tokens": 0}
+
+        self._cache_usage(user_id, usage)
+        return usage
+
+    def _cache_usage(self, user_id: str, usage: Dict[str, int]):
+        """Keep usage in the usage cache, evicting the least recently used."""
+        with self.usage_cache_lock:
+            self.usage_cache[user_id] = (
+                dict(usage),
+                time.monotonic() + USAGE_CACHE_TTL_SECONDS,
+            )
+            self.usage_cache.move_to_end(user_id)
+            if len(self.usage_cache) > USAGE_CACHE_MAX_ENTRIES:
+                self.usage_cache.popitem(last=False)
+
+    def _read_usage(
+        self, user_id: str, now: datetime.datetime
+    ) -> Optional[Dict[str, int]]:
+        """
+        Read token usage for this time period from DynamoDB.
         For periods that need aggregation, it will query and aggregate.
         For direct periods, it will query the specific record.
-        """
-        now = datetime.datetime.now()
+        Returns None if the read failed.
 
+        Usage is read eventually consistently, at half the cost of a strongly
+        consistent read. Limits are checked against usage recorded after
+        earlier requests completed, so a read a moment out of date only
+        lets a request through that would have been checked just before.
+        """
         if self.period_config["aggregate"]:
             # This period needs aggregation (like summing 10min windows for daily usage)
             query_window = self.period_config["query_window"]
@@ -206,12 +321,14 @@ class TokenMeter:
                             ":start": {"S": start_key},
                             ":end": {"S": end_key},
                         },
+                        ProjectionExpression="input_tokens, output_tokens",
+                        ConsistentRead=False,
                     )
                     # Aggregate the results (no filtering needed as the query handles the time range)
                     return self._sum_period_usage(response.get("Items", []))
                 except Exception as e:
                     logger.error(f"Error querying DynamoDB: {e}")
-                    return {"input_tokens": 0, "output_tokens": 0}
+                    return None
             else:
                 # No query window specified, aggregate all records of this type
                 try:
@@ -222,19 +339,23 @@ class TokenMeter:
                             ":uid": {"S": user_id},
                             ":prefix": {"S": self.period_config["prefix"]},
                         },
+                        ProjectionExpression="input_tokens, output_tokens",
+                        ConsistentRead=False,
                     )
                     return self._sum_period_usage(response.get("Items", []))
                 except Exception as e:
                     logger.error(f"Error querying DynamoDB: {e}")
-                    return {"input_tokens": 0, "output_tokens": 0}
+                    return None
         else:
             # This is a direct period (like monthly)
-            period_id = self.period_config["id_format"](now)
+            period_id = now.strftime(self.id_format)
 
             try:
                 response = self.dynamodb.get_item(
                     TableName=self.table_name,
                     Key={"user_id": {"S": user_id}, "period_id": {"S": period_id}},
+                    ProjectionExpression="input_tokens, output_tokens",
+                    ConsistentRead=False,
                 )
                 item = response.get("Item", {})
                 input_tokens = int(item.get("input_tokens", {}).get("N", "0"))
@@ -242,7 +363,7 @@ class TokenMeter:
                 return {"input_tokens": input_tokens, "output_tokens": output_tokens}
             except Exception as e:
                 logger.error(f"Error getting item from DynamoDB: {e}")
-                return {"input_tokens": 0, "output_tokens": 0}
+                return None
 
     def _sum_period_usage(self, items: List[Dict[str, Any]]) -> Dict[str, int]:
         """
@@ -252,24 +373,37 @@ class TokenMeter:
         total_input = 0
         total_output = 0
 
+        # update_usage always writes both counters together
         for item in items:
-            total_input += int(item.get("input_tokens", {}).get("N", "0"))
-            total_output += int(item.get("output_tokens", {}).get("N", "0"))
+            if "input_tokens" in item:
+                total_input += int(item["input_tokens"]["N"])
+                total_output += int(item["output_tokens"]["N"])
 
         return {"input_tokens": total_input, "output_tokens": total_output}
 
-    def update_usage(self, user_id: str, input_tokens: int, output_tokens: int) -> bool:
+    def update_usage(
+        self,
+        user_id: str,
+        input_tokens: int,
+        output_tokens: int,
+        request_id: Optional[str] = None,
+        now: Optional[datetime.datetime] = None,
+    ) -> bool:
         """
-        Update token usage for this time period.
+        Update token usage for this time period, counting it in the period of
+        now (defaults to the current time).
         Uses DynamoDB's atomic counter feature to increment usage.
+
+        The update is conditional on the record not being last updated with
+        the same request ID, so a retried request is only counted once.
         Returns True if the update was successful, False otherwise.
         """
+        request_id = request_id or uuid.uuid4().hex
+        now = now or datetime.datetime.now()
         try:
-            now = datetime.datetime.now()
 
             # Calculate the period ID based on the current time and period configuration
-            rounded_time = self.period_config["round_time"](now)
-            period_id = self.period_config["id_format"](rounded_time)
+            period_id = self.round_time(now).strftime(self.id_format)
 
             # Calculate TTL based on the period configuration
             if callable(self.period_config["ttl_delta"]):
@@ -280,22 +414,57 @@ class TokenMeter:
             ttl_time = now + ttl_delta
             ttl_value = int(ttl_time.timestamp())
 
-            # Update the record using atomic counters
-            self.dynamodb.update_item(
+            # Update the record using atomic counters. The counters of a direct
+            # period are its usage, so their new values are returned to refresh
+            # the usage cache.
+            aggregate = self.period_config["aggregate"]
+            response = self.dynamodb.update_item(
                 TableName=self.table_name,
                 Key={"user_id": {"S": user_id}, "period_id": {"S": period_id}},
-                UpdateExpression="ADD input_tokens :i, output_tokens :o SET #ts = if_not_exists(#ts, :ts), #ttl = :ttl",
+                UpdateExpression=self.UPDATE_EXPRESSION,
+                ConditionExpression=self.UPDATE_CONDITION,
                 ExpressionAttributeValues={
                     ":i": {"N": str(input_tokens)},
                     ":o": {"N": str(output_tokens)},
+                    ":rid": {"S": request_id},
                     ":ts": {"N": str(int(now.timestamp()))},
                     ":ttl": {"N": str(ttl_value)},
                 },
-                ExpressionAttributeNames={"#ts": "timestamp", "#ttl": "ttl"},
+                ExpressionAttributeNames=self.UPDATE_ATTRIBUTE_NAMES,
+                ReturnValues="NONE" if aggregate else "UPDATED_NEW",
             )
 
+            # Keep the cached usage in step with what was just recorded
+            if aggregate:
+                with self.usage_cache_lock:
+                    entry = self.usage_cache.get(user_id)
+                    if entry is not None:
+                        entry[0]["input_tokens"] += input_tokens
+                        entry[0]["output_tokens"] += output_tokens
+            else:
+                attributes = response.get("Attributes", {})
+                self._cache_usage(
+                    user_id,
+                    {
+                        "input_tokens": int(attributes["input_tokens"]["N"]),
+                        "output_tokens": int(attributes["output_tokens"]["N"]),
+                    },
+                )
+
             return True
         except Exception as e:
+            error_response = getattr(e, "response", None) or {}
+            error_code = error_response.get("Error", {}).get("Code")
+            if error_code == "ConditionalCheckFailedException":
+                # A retry of an update that was already applied. Its result
+                # was lost, so the cached usage may be behind.
+                with self.usage_cache_lock:
+                    self.usage_cache.pop(user_id, None)
+                logger.debug(
+                    "Token usage already updated",
+                    extra={"user_id": user_id, "request_id": request_id},
+                )
+                return True
             logger.error(
                 "Error updating token usage",
                 extra={
@@ -331,15 +500,17 @@ class TokenLimiter:
         self.reservation_manager = TokenReservationManager()
 
     def is_limit_exceeded(
-        self, user_id: str
+        self, user_id: str, now: Optional[datetime.datetime] = None
     ) -> Tuple[bool, Optional[str], Optional[str], Dict[str, int]]:
         """
-        Check if the user has exceeded any token limits across all meters.
+        Check if the user has exceeded any token limits across all meters,
+        as of now (defaults to the current time).
         Returns a tuple (is_exceeded, token_type, period_description, usage_data) where:
         - is_exceeded: Boolean indicating if any limit is exceeded
         - token_type: 'input' or 'output' indicating which type of token limit was exceeded
         - period_description: Description of the time period (e.g., 'daily', 'monthly')
-        - usage_data: Dictionary containing token usage information
+        - usage_data: Dictionary containing the daily and monthly token usage;
+          input_tokens and output_tokens are the daily usage
         """
         # Initialize usage data with zeros
         total_usage = {
@@ -351,9 +522,14 @@ class TokenLimiter:
             "daily_output_tokens": 0,
         }
 
-        # Check each meter and collect usage data
-        for meter in self.meters:
-            is_exceeded, token_type, usage = meter.is_limit_exceeded(user_id)
+        # Read all meters concurrently, then check them in order
+        now = now or datetime.datetime.now()
+        checks = [
+            meter_executor.submit(meter.is_limit_exceeded, user_id, now)
+            for meter in self.meters
+        ]
+        for meter, check in zip(self.meters, checks):
+            is_exceeded, token_type, usage = check.result()
 
             # Update usage data based on meter type
             if meter.name == "monthly":
@@ -362,121 +538,183 @@ class TokenLimiter:
             elif meter.name == "10min":  # This is the daily meter
                 total_usage["daily_input_tokens"] = usage["input_tokens"]
                 total_usage["daily_output_tokens"] = usage["output_tokens"]
-
-            # Update total usage (use the highest values)
-            total_usage["input_tokens"] = max(
-                total_usage["input_tokens"], usage["input_tokens"]
-            )
-            total_usage["output_tokens"] = max(
-                total_usage["output_tokens"], usage["output_tokens"]
-            )
+                # The unqualified totals are the daily usage
+                total_usage["input_tokens"] = usage["input_tokens"]
+                total_usage["output_tokens"] = usage["output_tokens"]
 
             if is_exceeded:
                 return True, token_type, meter.description, total_usage
 
         return False, None, None, total_usage
 
-    def update_usage(self, user_id: str, input_tokens: int, output_tokens: int) -> bool:
+    def update_usage(
+        self,
+        user_id: str,
+        input_tokens: int,
+        output_tokens: int,
+        now: Optional[datetime.datetime] = None,
+    ) -> bool:
         """
-        Update token usage across all meters.
+        Update token usage across all meters, as of now (defaults to the
+        current time).
         Returns True if all updates were successful, False otherwise.
         """
-        success = True
-        for meter in self.meters:
-            if not meter.update_usage(user_id, input_tokens, output_tokens):
-                success = False
-
-        return success
+        # Identifies this update, so that retried writes are not counted twice
+        request_id = uuid.uuid4().hex
+        now = now or datetime.datetime.now()
+        updates = [
+            meter_executor.submit(
+                meter.update_usage,
+                user_id,
+                input_tokens,
+                output_tokens,
+                request_id,
+                now,
+            )
+            for meter in self.meters
+        ]
+        return all([update.result() for update in updates])
 
     def is_limit_exceeded_with_reservation(
-        self, user_id: str
+        self,
+        user_id: str,
+        usage_data: Optional[Dict[str, int]] = None,
+        now: Optional[datetime.datetime] = None,
     ) -> Tuple[bool, Optional[str], Optional[str], Dict[str, int]]:
         """
         Check if the user would exceed limits if we create a new reservation.
         This includes checking current usage + existing reservations + new reservation.
 
+        If usage_data from a is_limit_exceeded call that passed is given, the
+        meters are not read again and only the reservation check is done.
+        The check is made as of now, which defaults to the current time.
+
         Returns a tuple (is_exceeded, token_type, period_description, usage_data) where:
         - is_exceeded: Boolean indicating if creating a new reservation would exceed limits
         - token_type: 'input' or 'output' indicating which type of token limit would be exceeded
         - period_description: Description of the time period (e.g., 'daily', 'monthly')
         - usage_data: Dictionary containing token usage information including reservations
         """
-        # First check regular limits (this gets current usage)
-        is_exceeded, token_type, period, usage_data = self.is_limit_exceeded(user_id)
+        return self._check_with_reservation(
+            user_id, usage_data, now or datetime.datetime.now()
+        )[0]
 
-        if is_exceeded:
-            return True, token_type, period, usage_data
+    def _check_with_reservation(
+        self,
+        user_id: str,
+        usage_data: Optional[Dict[str, int]],
+        now: datetime.datetime,
+    ) -> Tuple[
+        Tuple[bool, Optional[str], Optional[str], Dict[str, int]],
+        Optional[Dict[str, int]],
+    ]:
+        """
+        Check as is_limit_exceeded_with_reservation does, also returning the
+        reservation counters the check was made against.
+        """
+        if usage_data is None:
+            # Read the reservations while the meters are read
+            read = meter_executor.submit(
+                self.reservation_manager.get_reserved_tokens, user_id, now
+            )
+
+            # First check regular limits (this gets current usage)
+            is_exceeded, token_type, period, usage_data = self.is_limit_exceeded(
+                user_id, now
+            )
+
+            if is_exceeded:
+                return (True, token_type, period, usage_data), None
+            reserved = read.result()
+        else:
+            # Don't add reservation info to the caller's usage data
+            usage_data = dict(usage_data)
+            reserved = self.reservation_manager.get_reserved_tokens(user_id, now)
+        total_reserved = max(sum(reserved.values()), 0) if reserved else 0
 
         # Now check if adding a new reservation would exceed the daily output limit
         # We only apply reservation logic to daily output tokens
-        daily_output_limit = int(os.environ.get("DAILY_OUTPUT_LIMIT", 20000))
-        reservation_amount = int(daily_output_limit * 0.5)
-
-        # Get current reservations
-        total_reserved = self.reservation_manager.get_total_reserved_tokens(user_id)
 
         # Check if current usage + existing reservations + new reservation > daily limit
         current_daily_output = usage_data.get("daily_output_tokens", 0)
         total_with_new_reservation = (
-            current_daily_output + total_reserved + reservation_amount
+            current_daily_output + total_reserved + RESERVATION_AMOUNT
         )
 
-        if total_with_new_reservation > daily_output_limit:
+        if total_with_new_reservation > DAILY_OUTPUT_LIMIT:
             # Add reservation info to usage data
             usage_data["total_reserved_tokens"] = total_reserved
-            usage_data["new_reservation_amount"] = reservation_amount
+            usage_data["new_reservation_amount"] = RESERVATION_AMOUNT
             usage_data["total_with_reservation"] = total_with_new_reservation
 
-            logger.info(
-                "Reservation would exceed daily output limit",
-                extra={
-                    "user_id": user_id,
-                    "current_daily_output": current_daily_output,
-                    "total_reserved": total_reserved,
-                    "new_reservation": reservation_amount,
-                    "total_with_reservation": total_with_new_reservation,
-                    "daily_limit": daily_output_limit,
-                },
-            )
+            if logger.isEnabledFor(logging.INFO):
+                logger.info(
+                    "Reservation would exceed daily output limit",
+                    extra={
+                        "user_id": user_id,
+                        "current_daily_output": current_daily_output,
+                        "total_reserved": total_reserved,
+                        "new_reservation": RESERVATION_AMOUNT,
+                        "total_with_reservation": total_with_new_reservation,
+                        "daily_limit": DAILY_OUTPUT_LIMIT,
+                    },
+                )
 
-            return True, "output", "daily", usage_data
+            return (True, "output", "daily", usage_data), reserved
 
         # Add reservation info to usage data for transparency
         usage_data["total_reserved_tokens"] = total_reserved
-        usage_data["new_reservation_amount"] = reservation_amount
+        usage_data["new_reservation_amount"] = RESERVATION_AMOUNT
         usage_data["total_with_reservation"] = total_with_new_reservation
 
-        return False, None, None, usage_data
+        return (False, None, None, usage_data), reserved
 
-    def create_reservation(self, user_id: str) -> Optional[str]:
+    def create_reservation(
+        self,
+        user_id: str,
+        usage_data: Optional[Dict[str, int]] = None,
+        now: Optional[datetime.datetime] = None,
+    ) -> Optional[str]:
         """
         Create a token reservation if limits allow it.
 
         Args:
             user_id: The user ID to create the reservation for
+            usage_data: Optional usage data from a is_limit_exceeded call that
+                passed, to avoid reading the meters again
+            now: Time of the reservation, defaults to the current time
 
         Returns:
             The reservation ID if successful, None if failed or would exceed limits
         """
-        # Check if creating a reservation would exceed limits
-        is_exceeded, token_type, period, usage_data = (
-            self.is_limit_exceeded_with_reservation(user_id)
-        )
+        now = now or datetime.datetime.now()
+        for _ in range(RESERVATION_ATTEMPTS):
+            # Check if creating a reservation would exceed limits
+            (is_exceeded, token_type, period, usage_data), reserved = (
+                self._check_with_reservation(user_id, usage_data, now)
+            )
 
-        if is_exceeded:
-            logger.warning(
-                "Cannot create reservation - would exceed limits",
-                extra={
-                    "user_id": user_id,
-                    "token_type": token_type,
-                    "period": period,
-                    "usage_data": usage_data,
-                },
+            if is_exceeded:
+                logger.warning(
+                    "Cannot create reservation - would exceed limits",
+                    extra={
+                        "user_id": user_id,
+                        "token_type": token_type,
+                        "period": period,
+                        "usage_data": usage_data,
+                    },
+                )
+                return None
+
+            # Create the reservation, unless another was made since the check,
+            # in which case the check is repeated
+            reservation_id = self.reservation_manager.create_reservation(
+                user_id, now, reserved
             )
-            return None
+            if reservation_id is not None:
+                return reservation_id
 
-        # Create the reservation
-        return self.reservation_manager.create_reservation(user_id)
+        return None
 
     def remove_reservation(self, user_id: str, reservation_id: str) -> bool:
         """
@@ -499,12 +737,45 @@ class TokenLimiter:
         return {meter.name: meter.period_config["input_limit"] for meter in self.meters}
 
 
+@lru_cache(maxsize=128)
+def reservation_bucket_id(minute: int) -> str:
+    """
+    Get the period ID of the reservation counter for a minute.
+
+    Args:
+        minute: Minutes since the epoch
+
+    Returns:
+        The period ID, such as 'reservation:2025-01-08:10:05'
+    """
+    # Each check looks up the last reservation TTL minutes, of which only the
+    # latest is new, so the IDs are cached and formatted without strftime
+    dt = datetime.datetime.fromtimestamp(minute * 60)
+    return (
+        f"reservation:{dt.year:04d}-{dt.month:02d}-{dt.day:02d}"
+        f":{dt.hour:02d}:{dt.minute:02d}"
+    )
+
+
 class TokenReservationManager:
     """
     Manages token reservations to prevent race conditions in concurrent requests.
     Uses the same DynamoDB table as TokenMeter with special reservation period_ids.
+
+    Reservations are added to a counter item per user and minute, named after
+    the minute. The reserved total is the sum of the counters of the last
+    reservation TTL minutes, so a reservation that is never removed expires
+    once its minute drops out of that range.
+
+    A reservation made after a check of the reserved total is only added if
+    the counters of the previous, current and next minute are unchanged
+    since the check.
     """
 
+    # Parts of the reservation counter update that are the same for every call
+    UPDATE_EXPRESSION = "ADD output_tokens :o SET #ttl = if_not_exists(#ttl, :ttl)"
+    UPDATE_ATTRIBUTE_NAMES = {"#ttl": "ttl"}
+
     def __init__(self, dynamodb_client=None, table_name: Optional[str] = None):
         """
         Initialize the TokenReservationManager.
@@ -513,65 +784,157 @@ class TokenReservationManager:
             dynamodb_client: Optional boto3 DynamoDB client
             table_name: Optional DynamoDB table name (defaults to env var or 'UserTokenUsage')
         """
-        self.dynamodb = dynamodb_client or boto3.client("dynamodb")
+        self.dynamodb = dynamodb_client or get_dynamodb_client()
         self.table_name = table_name or os.environ.get(
             "TOKEN_USAGE_TABLE", "UserTokenUsage"
         )
-        self.reservation_ttl_minutes = int(
-            os.environ.get("RESERVATION_TTL_MINUTES", "10")
-        )
+        self.reservation_ttl_minutes = RESERVATION_TTL_MINUTES
+
+        # Reservations made here and not yet removed. A reservation may be
+        # removed more than once, but must only be subtracted once.
+        self.open_reservations = set()
+
+    def _counter_update(
+        self, user_id: str, bucket_id: str, output_tokens: int, now: datetime.datetime
+    ) -> Dict[str, Any]:
+        """Build the update that adds output tokens to a reservation counter."""
+        # The counter is read for the reservation TTL after its minute
+        ttl_time = now + datetime.timedelta(minutes=self.reservation_ttl_minutes + 1)
+        return {
+            "TableName": self.table_name,
+            "Key": {"user_id": {"S": user_id}, "period_id": {"S": bucket_id}},
+            "UpdateExpression": self.UPDATE_EXPRESSION,
+            "ExpressionAttributeValues": {
+                ":o": {"N": str(output_tokens)},
+                ":ttl": {"N": str(int(ttl_time.timestamp()))},
+            },
+            "ExpressionAttributeNames": self.UPDATE_ATTRIBUTE_NAMES,
+        }
+
+    @staticmethod
+    def _unchanged_condition(expected: int) -> str:
+        """Condition that a reservation counter still holds the value read."""
+        if expected == 0:
+            return "attribute_not_exists(output_tokens) OR output_tokens = :expected"
+        return "output_tokens = :expected"
 
-    def create_reservation(self, user_id: str) -> Optional[str]:
+    def _reserve_if_unchanged(
+        self,
+        user_id: str,
+        minute: int,
+        update: Dict[str, Any],
+        reserved: Dict[str, int],
+    ):
+        """
+        Apply a reservation counter update in a transaction that fails if
+        another reservation was added since the counters were read.
+
+        Concurrent reservations are added to the counter of the current
+        minute, which must still hold the value read; to the previous
+        minute's counter by requests that started before the minute turned,
+        which must also still hold the value read; or to the next minute's
+        counter by requests that started after the read, which must still be
+        empty. A request that writes its reservation more than a minute after
+        it started is not detected.
+        """
+        expected = reserved.get(update["Key"]["period_id"]["S"], 0)
+        update["ConditionExpression"] = self._unchanged_condition(expected)
+        update["ExpressionAttributeValues"][":expected"] = {"N": str(expected)}
+        items = [
+            {"Update": update},
+            {
+                "ConditionCheck": {
+                    "TableName": self.table_name,
+                    "Key": {
+                        "user_id": {"S": user_id},
+                        "period_id": {"S": reservation_bucket_id(minute + 1)},
+                    },
+                    "ConditionExpression": "attribute_not_exists(output_tokens) OR output_tokens <= :zero",
+                    "ExpressionAttributeValues": {":zero": {"N": "0"}},
+                }
+            },
+        ]
+
+        # The previous minute's counter is only read if it is counted
+        if self.reservation_ttl_minutes > 1:
+            previous_id = reservation_bucket_id(minute - 1)
+            previous = reserved.get(previous_id, 0)
+            items.append(
+                {
+                    "ConditionCheck": {
+                        "TableName": self.table_name,
+                        "Key": {
+                            "user_id": {"S": user_id},
+                            "period_id": {"S": previous_id},
+                        },
+                        "ConditionExpression": self._unchanged_condition(previous),
+                        "ExpressionAttributeValues": {
+                            ":expected": {"N": str(previous)}
+                        },
+                    }
+                }
+            )
+
+        self.dynamodb.transact_write_items(TransactItems=items)
+
+    def create_reservation(
+        self,
+        user_id: str,
+        now: Optional[datetime.datetime] = None,
+        reserved: Optional[Dict[str, int]] = None,
+    ) -> Optional[str]:
         """
         Create a reservation for 50% of the daily output token limit.
 
         Args:
             user_id: The user ID to create the reservation for
+            now: Time of the reservation, defaults to the current time
+            reserved: Reservation counters from get_reserved_tokens at the same
+                time, checked by the caller. If given, the reservation is only
+                made if no reservation was made around the same minute since
+                they were read.
 
         Returns:
             The reservation ID if successful, None if failed
         """
         try:
-            # Get daily output limit (50% reservation)
-            daily_output_limit = int(os.environ.get("DAILY_OUTPUT_LIMIT", 20000))
-            reservation_amount = int(daily_output_limit * 0.5)
-
-            # Generate unique reservation ID
-            reservation_uuid = str(uuid.uuid4())
-            now = datetime.datetime.now()
-            date_str = now.strftime("%Y-%m-%d")
-            reservation_id = f"reservation:daily:{date_str}:{reservation_uuid}"
-
-            # Calculate TTL
-            ttl_time = now + datetime.timedelta(minutes=self.reservation_ttl_minutes)
-            ttl_value = int(ttl_time.timestamp())
-
-            # Create reservation record
-            self.dynamodb.put_item(
-                TableName=self.table_name,
-                Item={
-                    "user_id": {"S": user_id},
-                    "period_id": {"S": reservation_id},
-                    "input_tokens": {"N": "0"},
-                    "output_tokens": {"N": str(reservation_amount)},
-                    "timestamp": {"N": str(int(now.timestamp()))},
-                    "ttl": {"N": str(ttl_value)},
-                },
-            )
-
-            logger.info(
-                "Created token reservation",
-                extra={
-                    "user_id": user_id,
-                    "reservation_id": reservation_id,
-                    "reservation_amount": reservation_amount,
-                    "ttl_minutes": self.reservation_ttl_minutes,
-                },
-            )
+            # The reservation ID names the counter it was added to
+            now = now or datetime.datetime.now()
+            minute = int(now.timestamp()) // 60
+            bucket_id = reservation_bucket_id(minute)
+            reservation_id = f"{bucket_id}:{uuid.uuid4()}"
+
+            update = self._counter_update(user_id, bucket_id, RESERVATION_AMOUNT, now)
+            if reserved is None:
+                self.dynamodb.update_item(**update)
+            else:
+                self._reserve_if_unchanged(user_id, minute, update, reserved)
+            self.open_reservations.add(reservation_id)
+
+            # The handler logs the reservation it made; the details are only
+            # built when debug logging is on
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(
+                    "Created token reservation",
+                    extra={
+                        "user_id": user_id,
+                        "reservation_id": reservation_id,
+                        "reservation_amount": RESERVATION_AMOUNT,
+                        "ttl_minutes": self.reservation_ttl_minutes,
+                    },
+                )
 
             return reservation_id
 
         except Exception as e:
+            error_response = getattr(e, "response", None) or {}
+            error_code = error_response.get("Error", {}).get("Code")
+            if error_code == "TransactionCanceledException":
+                logger.info(
+                    "Reservation counters changed since they were checked",
+                    extra={"user_id": user_id},
+                )
+                return None
             logger.error(
                 "Error creating token reservation",
                 extra={
@@ -593,25 +956,34 @@ class TokenReservationManager:
             True if successful, False otherwise
         """
         try:
-            self.dynamodb.delete_item(
-                TableName=self.table_name,
-                Key={
-                    "user_id": {"S": user_id},
-                    "period_id": {"S": reservation_id},
-                },
-            )
+            self.open_reservations.remove(reservation_id)
+        except KeyError:
+            # Already removed
+            return True
 
-            logger.info(
-                "Removed token reservation",
-                extra={
-                    "user_id": user_id,
-                    "reservation_id": reservation_id,
-                },
+        try:
+            bucket_id = reservation_id.rsplit(":", 1)[0]
+
+            self.dynamodb.update_item(
+                **self._counter_update(
+                    user_id, bucket_id, -RESERVATION_AMOUNT, datetime.datetime.now()
+                )
             )
 
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug(
+                    "Removed token reservation",
+                    extra={
+                        "user_id": user_id,
+                        "reservation_id": reservation_id,
+                    },
+                )
+
             return True
 
         except Exception as e:
+            # Keep the reservation so that removing it can be retried
+            self.open_reservations.add(reservation_id)
             logger.error(
                 "Error removing token reservation",
                 extra={
@@ -622,118 +994,83 @@ class TokenReservationManager:
             )
             return False
 
-    def get_active_reservations(self, user_id: str) -> List[Dict[str, Any]]:
+    def get_reserved_tokens(
+        self, user_id: str, now: Optional[datetime.datetime] = None
+    ) -> Optional[Dict[str, int]]:
         """
-        Get all active reservations for a user.
+        Get the reservation counters that are currently counted for a user.
 
         Args:
             user_id: The user ID
+            now: Time to get the counters at, defaults to the current time
 
         Returns:
-            List of reservation records
+            Reserved output tokens by counter period ID, for the counters that
+            exist, or None if they could not be read
         """
         try:
-            now = datetime.datetime.now()
-            date_str = now.strftime("%Y-%m-%d")
-            reservation_prefix = f"reservation:daily:{date_str}:"
-
-            response = self.dynamodb.query(
-                TableName=self.table_name,
-                KeyConditionExpression="user_id = :uid AND begins_with(period_id, :prefix)",
-                ExpressionAttributeValues={
-                    ":uid": {"S": user_id},
-                    ":prefix": {"S": reservation_prefix},
-                },
-            )
-
-            reservations = []
-            for item in response.get("Items", []):
-                reservations.append(
-                    {
-                        "reservation_id": item["period_id"]["S"],
-                        "output_tokens": int(
-                            item.get("output_tokens", {}).get("N", "0")
-                        ),
-                        "timestamp": int(item.get("timestamp", {}).get("N", "0")),
+            now = now or datetime.datetime.now()
+            minute = int(now.timestamp()) // 60
+            keys = [
+                {
+                    "user_id": {"S": user_id},
+                    "period_id": {"S": reservation_bucket_id(minute - age)},
+                }
+                for age in range(self.reservation_ttl_minutes)
+            ]
+
+            # Reservations are made and checked concurrently, so the counters
+            # are read consistently. BatchGetItem takes up to 100 keys.
+            reserved = {}
+            for start in range(0, len(keys), 100):
+                request = {
+                    self.table_name: {
+                        "Keys": keys[start : start + 100],
+                        "ProjectionExpression": "period_id, output_tokens",
+                        "ConsistentRead": True,
                     }
-                )
+                }
+                for attempt in range(BATCH_GET_MAX_ATTEMPTS):
+                    if attempt:
+                        time.sleep(0.05 * 2**attempt)
+                    response = self.dynamodb.batch_get_item(RequestItems=request)
+                    for item in response.get("Responses", {}).get(self.table_name, []):
+                        reserved[item["period_id"]["S"]] = int(
+                            item.get("output_tokens", {}).get("N", "0")
+                        )
+                    request = response.get("UnprocessedKeys")
+                    if not request:
+                        break
+                else:
+                    # A partial total would understate the reserved tokens
+                    raise RuntimeError("Reservation counters left unprocessed")
 
-            return reservations
+            return reserved
 
         except Exception as e:
             logger.error(
-                "Error getting active reservations",
+                "Error getting reserved tokens",
                 extra={
                     "error": str(e),
                     "user_id": user_id,
                 },
             )
-            return []
+            return None
 
-    def get_total_reserved_tokens(self, user_id: str) -> int:
+    def get_total_reserved_tokens(
+        self, user_id: str, now: Optional[datetime.datetime] = None
+    ) -> int:
         """
         Get the total number of output tokens currently reserved for a user.
 
         Args:
             user_id: The user ID
+            now: Time to get the reserved total at, defaults to the current time
 
         Returns:
             Total reserved output tokens
         """
-        reservations = self.get_active_reservations(user_id)
-        return sum(r["output_tokens"] for r in reservations)
-
-    def cleanup_expired_reservations(self, user_id: str) -> int:
-        """
-        Manually cleanup expired reservations for a user.
-        Note: TTL should handle this automatically, but this provides manual cleanup.
-
-        Args:
-            user_id: The user ID
-
-        Returns:
-            Number of reservations cleaned up
-        """
-        try:
-            now = datetime.datetime.now()
-            current_timestamp = int(now.timestamp())
-
-            # Get all reservations (not just today's)
-            response = self.dynamodb.query(
-                TableName=self.table_name,
-                KeyConditionExpression="user_id = :uid AND begins_with(period_id, :prefix)",
-                ExpressionAttributeValues={
-                    ":uid": {"S": user_id},
-                    ":prefix": {"S": "reservation:"},
-                },
-            )
-
-            cleaned_count = 0
-            for item in response.get("Items", []):
-                ttl_value = int(item.get("ttl", {}).get("N", "0"))
-                if ttl_value > 0 and current_timestamp > ttl_value:
-                    # This reservation has expired
-                    reservation_id = item["period_id"]["S"]
-                    if self.remove_reservation(user_id, reservation_id):
-                        cleaned_count += 1
-
-            if cleaned_count > 0:
-                logger.info(
-                    "Cleaned up expired reservations",
-                    extra={
-                        "user_id": user_id,
-                        "cleaned_count": cleaned_count,
-                    },
-                )
-
-            return cleaned_count
-
-        except Exception as e:
-            logger.error(
-                "Error cleaning up expired reservations",
-                extra={
-                    "error": str(e),
-                    "user_id": user_id,
-                },
-            )
+        reserved = self.get_reserved_tokens(user_id, now)
+        if not reserved:
             return 0
+        return max(sum(reserved.values()), 0)
@@ -0,0 +1,29 @@
+"""
+Shared test fixtures.
+"""
+
+import pytest
+
+# Token usage settings of the tests, which the token_meter module reads when
+# it is imported
+TOKEN_ENVIRONMENT = {
+    "TOKEN_USAGE_TABLE": "test-token-usage",
+    "DAILY_INPUT_LIMIT": "10000",
+    "DAILY_OUTPUT_LIMIT": "20000",
+    "MONTHLY_INPUT_LIMIT": "100000",
+    "MONTHLY_OUTPUT_LIMIT": "200000",
+    "RESERVATION_TTL_MINUTES": "10",
+}
+
+
+@pytest.fixture(scope="session", autouse=True)
+def token_environment():
+    """
+    Set the token usage environment variables once for the whole session,
+    restoring them afterwards. Tests needing other values override them with
+    monkeypatch.
+    """
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        for name, value in TOKEN_ENVIRONMENT.items():
+            monkeypatch.setenv(name, value)
+        yield
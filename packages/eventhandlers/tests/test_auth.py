@@ -0,0 +1,52 @@
+"""
+Tests for channel authorization.
+"""
+
+from eventhandlers.auth import AuthResult, validate_channel_auth
+
+
+def make_event(segments=None, sub="user-123"):
+    """Build an AppSync event for the given channel segments and sub."""
+    event = {"info": {"channel": {"segments": segments}}}
+    if sub is not None:
+        event["identity"] = {"sub": sub}
+    return event
+
+
+class TestValidateChannelAuth:
+    """Test the validate_channel_auth function."""
+
+    def test_authorized(self):
+        """Test that a matching sub is authorized with the channel path."""
+        result = validate_channel_auth(make_event(["chat", "user-123", "conv-1"]))
+
+        assert result == AuthResult(True, "user-123", "user-123/conv-1", None)
+
+    def test_sub_mismatch(self):
+        """Test that a sub not matching the first path segment is rejected."""
+        result = validate_channel_auth(make_event(["chat", "other-user"]))
+
+        assert result == AuthResult(False, "user-123", None, "Unauthorized")
+
+    def test_missing_segments(self):
+        """Test that a missing channel is rejected."""
+        result = validate_channel_auth({"identity": {"sub": "user-123"}})
+
+        assert not result.is_authorized
+        assert result.sub == "user-123"
+        assert result.error_message == "No segments found in channel path"
+
+    def test_missing_identity(self):
+        """Test that an event without identity is rejected."""
+        result = validate_channel_auth(make_event(["chat", "user-123"], sub=None))
+
+        assert result == AuthResult(False, None, None, "Unauthorized")
+
+    def test_path_segment_counts(self):
+        """Test that the path joins every segment after the channel name."""
+        for segments, path in [
+            (["chat", "user-123"], "user-123"),
+            (["chat", "user-123", "a"], "user-123/a"),
+            (["chat", "user-123", "a", "b"], "user-123/a/b"),
+        ]:
+            assert validate_channel_auth(make_event(segments)).path == path
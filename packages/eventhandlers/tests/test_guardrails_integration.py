@@ -13,82 +13,97 @@ express or implied. See the License for the specific language governing
 permissions and limitations under the License.
 """
 
-import os
 import pytest
-from unittest.mock import patch
 from eventhandlers.guardrails_integration import BedrockGuardrailsIntegration
 
+pytestmark = pytest.mark.fast
+
+
+@pytest.fixture
+def integration(request, monkeypatch):
+    """Integration built from a (guardrail_id, guardrail_version) parameter"""
+    monkeypatch.delenv("BEDROCK_GUARDRAIL_ID", raising=False)
+    monkeypatch.delenv("BEDROCK_GUARDRAIL_VERSION", raising=False)
+    guardrail_id, guardrail_version = request.param
+    return BedrockGuardrailsIntegration(
+        guardrail_id=guardrail_id, guardrail_version=guardrail_version
+    )
+
+
+@pytest.fixture(scope="class")
+def enabled_integration():
+    """Integration with a guardrail, shared by the tests of a class"""
+    return BedrockGuardrailsIntegration(
+        guardrail_id="test-guardrail-123", guardrail_version="2"
+    )
+
+
+@pytest.fixture(scope="class")
+def disabled_integration():
+    """Integration without a guardrail, shared by the tests of a class"""
+    with pytest.MonkeyPatch.context() as monkeypatch:
+        monkeypatch.delenv("BEDROCK_GUARDRAIL_ID", raising=False)
+        return BedrockGuardrailsIntegration()
+
 
 class TestBedrockGuardrailsIntegration:
     """Test cases for Bedrock Guardrails Integration"""
 
-    def test_initialization_with_environment_variables(self):
+    def test_initialization_with_environment_variables(self, monkeypatch):
         """Test initialization with environment variables"""
-        with patch.dict(
-            os.environ,
-            {
-                "BEDROCK_GUARDRAIL_ID": "test-guardrail-123",
-                "BEDROCK_GUARDRAIL_VERSION": "2",
-            },
-        ):
-            integration = BedrockGuardrailsIntegration()
-            assert integration.guardrail_id == "test-guardrail-123"
-            assert integration.guardrail_version == "2"
-            assert integration.is_enabled() is True
-
-    def test_initialization_without_environment_variables(self):
-        """Test initialization without environment variables"""
-        with patch.dict(os.environ, {}, clear=True):
-            integration = BedrockGuardrailsIntegration()
-            assert integration.guardrail_id is None
-            assert integration.guardrail_version == "1"  # default
-            assert integration.is_enabled() is False
-
-    def test_initialization_with_explicit_parameters(self):
-        """Test initialization with explicit parameters"""
-        integration = BedrockGuardrailsIntegration(
-            guardrail_id="explicit-guardrail-456", guardrail_version="3"
-        )
-        assert integration.guardrail_id == "explicit-guardrail-456"
-        assert integration.guardrail_version == "3"
+        monkeypatch.setenv("BEDROCK_GUARDRAIL_ID", "test-guardrail-123")
+        monkeypatch.setenv("BEDROCK_GUARDRAIL_VERSION", "2")
+
+        integration = BedrockGuardrailsIntegration()
+        assert integration.guardrail_id == "test-guardrail-123"
+        assert integration.guardrail_version == "2"
         assert integration.is_enabled() is True
 
-    def test_apply_guardrails_when_enabled(self):
-        """Test applying guardrails when enabled"""
-        integration = BedrockGuardrailsIntegration(
-            guardrail_id="test-guardrail-123", guardrail_version="2"
-        )
+    def test_initialization_without_environment_variables(self, monkeypatch):
+        """Test initialization without environment variables"""
+        monkeypatch.delenv("BEDROCK_GUARDRAIL_ID", raising=False)
+        monkeypatch.delenv("BEDROCK_GUARDRAIL_VERSION", raising=False)
+
+        integration = BedrockGuardrailsIntegration()
+        assert integration.guardrail_id is None
+        assert integration.guardrail_version == "1"  # default
+        assert integration.is_enabled() is False
 
+    def test_apply_guardrails_when_enabled(self, enabled_integration):
+        """Test applying guardrails when enabled"""
         request_params = {
             "modelId": "anthropic.claude-3-5-sonnet-20240620-v1:0",
             "messages": [{"role": "user", "content": [{"text": "Hello"}]}],
             "inferenceConfig": {"maxTokens": 512},
         }
 
-        result = integration.apply_guardrails_to_converse_request(request_params)
+        # The guardrails config is added and the original params are preserved;
+        # the request is updated in place, so the expected result is built first
+        expected = request_params | {
+            "guardrailConfig": {
+                "guardrailIdentifier": "test-guardrail-123",
+                "guardrailVersion": "2",
+                "streamProcessingMode": "sync",
+            }
+        }
 
-        # Check that guardrails config was added
-        assert "guardrailConfig" in result
-        assert result["guardrailConfig"]["guardrailIdentifier"] == "test-guardrail-123"
-        assert result["guardrailConfig"]["guardrailVersion"] == "2"
-        assert result["guardrailConfig"]["streamProcessingMode"] == "sync"
+        result = enabled_integration.apply_guardrails_to_converse_request(
+            request_params
+        )
 
-        # Check that original params are preserved
-        assert result["modelId"] == "anthropic.claude-3-5-sonnet-20240620-v1:0"
-        assert result["messages"] == [{"role": "user", "content": [{"text": "Hello"}]}]
-        assert result["inferenceConfig"]["maxTokens"] == 512
+        assert result == expected
 
-    def test_apply_guardrails_when_disabled(self):
+    def test_apply_guardrails_when_disabled(self, disabled_integration):
         """Test applying guardrails when disabled"""
-        integration = BedrockGuardrailsIntegration()  # No guardrail ID
-
         request_params = {
             "modelId": "anthropic.claude-3-5-sonnet-20240620-v1:0",
             "messages": [{"role": "user", "content": [{"text": "Hello"}]}],
             "inferenceConfig": {"maxTokens": 512},
         }
 
-        result = integration.apply_guardrails_to_converse_request(request_params)
+        result = disabled_integration.apply_guardrails_to_converse_request(
+            request_params
+        )
 
         # Check that no guardrails config was added
         assert "guardrailConfig" not in result
@@ -96,38 +111,26 @@ class TestBedrockGuardrailsIntegration:
         # Check that original params are unchanged
         assert result == request_params
 
-    def test_get_guardrail_info_when_enabled(self):
-        """Test getting guardrail info when enabled"""
-        integration = BedrockGuardrailsIntegration(
-            guardrail_id="test-guardrail-123", guardrail_version="2"
-        )
-
-        info = integration.get_guardrail_info()
-
-        assert info["guardrail_id"] == "test-guardrail-123"
-        assert info["guardrail_version"] == "2"
-
-    def test_get_guardrail_info_when_disabled(self):
-        """Test getting guardrail info when disabled"""
-        integration = BedrockGuardrailsIntegration()  # No guardrail ID
-
-        info = integration.get_guardrail_info()
-
-        assert info["guardrail_id"] is None
-        assert info["guardrail_version"] == "1"  # default
-
-    def test_is_enabled_logic(self):
-        """Test the is_enabled logic"""
-        # Enabled with guardrail ID
-        integration_enabled = BedrockGuardrailsIntegration(
-            guardrail_id="test-guardrail-123"
-        )
-        assert integration_enabled.is_enabled() is True
-
-        # Disabled without guardrail ID
-        integration_disabled = BedrockGuardrailsIntegration(guardrail_id=None)
-        assert integration_disabled.is_enabled() is False
-
-        # Disabled with empty string
-        integration_empty = BedrockGuardrailsIntegration(guardrail_id="")
-        assert integration_empty.is_enabled() is False
+    @pytest.mark.parametrize(
+        "integration, enabled, expected_info",
+        [
+            (
+                ("explicit-guardrail-456", "3"),
+                True,
+                {"guardrail_id": "explicit-guardrail-456", "guardrail_version": "3"},
+            ),
+            (
+                ("test-guardrail-123", None),
+                True,
+                {"guardrail_id": "test-guardrail-123", "guardrail_version": "1"},
+            ),
+            ((None, None), False, {"guardrail_id": None, "guardrail_version": "1"}),
+            (("", None), False, {"guardrail_id": None, "guardrail_version": "1"}),
+        ],
+        ids=["explicit", "default-version", "no-id", "empty-id"],
+        indirect=["integration"],
+    )
+    def test_configuration(self, integration, enabled, expected_info):
+        """Test is_enabled and get_guardrail_info for each configuration"""
+        assert integration.is_enabled() is enabled
+        assert integration.get_guardrail_info() == expected_info
@@ -0,0 +1,143 @@
+"""
+Tests for conversation tracking and logging to Firehose.
+"""
+
+import json
+from unittest.mock import Mock
+
+from eventhandlers import messages
+from eventhandlers.messages import FirehoseRecordBatcher, MessageTracker, encode_record
+
+
+def test_encode_record():
+    """Test that a record is encoded as a single line of JSON."""
+    record = {"user_id": "user", "user_message": "héllo", "input_tokens": 3}
+
+    data = encode_record(record)
+
+    assert data.endswith(b"\n")
+    assert data.count(b"\n") == 1
+    assert json.loads(data) == record
+
+
+class TestFirehoseRecordBatcher:
+    """Test batching of Firehose records."""
+
+    def setup_method(self):
+        """Set up test fixtures."""
+        self.mock_firehose = Mock()
+        self.mock_firehose.put_record_batch.return_value = {"FailedPutCount": 0}
+        self.batcher = FirehoseRecordBatcher(firehose_client=self.mock_firehose)
+
+    def test_records_buffered_until_flush(self):
+        """Test that records are sent in a single call when flushed."""
+        self.batcher.add("stream", b"record 0\n")
+        self.batcher.add("stream", b"record 1\n")
+        self.mock_firehose.put_record_batch.assert_not_called()
+
+        self.batcher.flush()
+
+        self.mock_firehose.put_record_batch.assert_called_once_with(
+            DeliveryStreamName="stream",
+            Records=[{"Data": b"record 0\n"}, {"Data": b"record 1\n"}],
+        )
+
+    def test_batches_of_500(self):
+        """Test that records are sent in batches of at most 500."""
+        for i in range(501):
+            self.batcher.add("stream", f"record {i}\n".encode())
+        self.batcher.flush()
+
+        batch_sizes = [
+            len(call[1]["Records"])
+            for call in self.mock_firehose.put_record_batch.call_args_list
+        ]
+        assert batch_sizes == [500, 1]
+
+    def test_failed_records_retried(self, monkeypatch):
+        """Test that only the records Firehose rejected are sent again."""
+        sleeps = []
+        monkeypatch.setattr(messages.time, "sleep", sleeps.append)
+        self.mock_firehose.put_record_batch.side_effect = [
+            {
+                "FailedPutCount": 1,
+                "RequestResponses": [
+                    {"RecordId": "1"},
+                    {"ErrorCode": "ServiceUnavailableException"},
+                ],
+            },
+            {"FailedPutCount": 0},
+        ]
+        self.batcher.add("stream", b"record 0\n")
+        self.batcher.add("stream", b"record 1\n")
+
+        self.batcher.flush()
+
+        retry_call = self.mock_firehose.put_record_batch.call_args_list[1]
+        assert retry_call[1]["Records"] == [{"Data": b"record 1\n"}]
+        assert not self.batcher.pending_records
+        assert sleeps == [messages.FIREHOSE_RETRY_DELAY_SECONDS]
+
+    def test_failed_call_retried_with_backoff(self, monkeypatch):
+        """Test that a failed call is retried, with a longer delay each time."""
+        sleeps = []
+        monkeypatch.setattr(messages.time, "sleep", sleeps.append)
+        self.mock_firehose.put_record_batch.side_effect = Exception("throttled")
+        self.batcher.add("stream", b"record 0\n")
+
+        self.batcher.flush()
+
+        assert (
+            self.mock_firehose.put_record_batch.call_count
+            == messages.FIREHOSE_MAX_ATTEMPTS
+        )
+        delay = messages.FIREHOSE_RETRY_DELAY_SECONDS
+        assert sleeps == [delay, delay * 2]
+
+    def test_flush_in_background(self):
+        """Test that a background flush is waited for by the next flush."""
+        self.batcher.add("stream", b"record 0\n")
+
+        self.batcher.flush(wait=False)
+        assert not self.batcher.pending_records
+        self.batcher.flush()
+
+        assert not self.batcher.sends
+        self.mock_firehose.put_record_batch.assert_called_once()
+
+
+class TestMessageTracker:
+    """Test tracking of the streamed assistant response."""
+
+    def setup_method(self):
+        """Set up test fixtures."""
+        self.tracker = MessageTracker("user", "conv", "hello", "model")
+
+    def _stream(self, *texts):
+        for text in texts:
+            self.tracker.process_stream_event(
+                {"contentBlockDelta": {"delta": {"text": text}}}
+            )
+
+    def test_response_collected_from_deltas(self):
+        """Test that deltas are combined into the response and its length."""
+        self._stream("Hello", ", ", "world")
+
+        assert self.tracker.assistant_response == "Hello, world"
+        assert self.tracker.response_length == 12
+        assert self.tracker.response_preview() == "Hello, world"
+
+    def test_response_preview_truncated(self):
+        """Test that the preview stops at the requested length."""
+        self._stream("a" * 60, "b" * 60, "c" * 60)
+
+        assert self.tracker.response_preview() == "a" * 60 + "b" * 40 + "..."
+
+    def test_metadata_processed_once(self):
+        """Test that token usage is taken from the first metadata event only."""
+        metadata = {"metadata": {"usage": {"inputTokens": 3, "outputTokens": 5}}}
+
+        assert self.tracker.process_stream_event(metadata)
+        assert not self.tracker.process_stream_event(metadata)
+        assert not self.tracker.process_stream_event({"messageStop": {}})
+        assert (self.tracker.input_tokens, self.tracker.output_tokens) == (3, 5)
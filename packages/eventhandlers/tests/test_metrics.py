@@ -0,0 +1,40 @@
+"""
+Tests for token usage metrics.
+"""
+
+import json
+
+from eventhandlers.metrics import flush_token_metrics, publish_token_metrics
+
+
+def emf_records(output):
+    """Parse the EMF records written to stdout."""
+    return [json.loads(line) for line in output.splitlines() if "_aws" in line]
+
+
+class TestTokenMetrics:
+    """Test publishing token metrics as EMF records."""
+
+    def test_metrics_collected_until_flush(self, capsys):
+        """Test that metrics for one model are written as a single record."""
+        publish_token_metrics("model-a", 10, 20, latency=5.0)
+        publish_token_metrics("model-a", 1, 2, is_cached=True)
+        assert emf_records(capsys.readouterr().out) == []
+
+        flush_token_metrics()
+
+        records = emf_records(capsys.readouterr().out)
+        assert len(records) == 1
+        assert records[0]["ModelId"] == "model-a"
+        assert records[0]["InputTokens"] == [10.0, 1.0]
+        assert records[0]["CachedResponses"] == [1.0]
+
+    def test_model_change_writes_record(self, capsys):
+        """Test that metrics for another model start a new record."""
+        publish_token_metrics("model-a", 10, 20)
+        publish_token_metrics("model-b", 1, 2)
+        flush_token_metrics()
+
+        records = emf_records(capsys.readouterr().out)
+        assert [r["ModelId"] for r in records] == ["model-a", "model-b"]
+        assert records[1]["InputTokens"] == [1.0]
@@ -0,0 +1,298 @@
+"""
+Tests for the response cache.
+"""
+
+from unittest.mock import Mock, patch
+
+from botocore.exceptions import ClientError
+
+from eventhandlers.response_cache import (
+    LOCAL_CACHE_TTL_SECONDS,
+    ResponseCache,
+    ScanBudget,
+)
+
+
+class ResponseCacheTest:
+    """Base class giving each test a cache with a mock DynamoDB client."""
+
+    def setup_method(self):
+        """Set up test fixtures."""
+        self.mock_dynamodb = Mock()
+        self.table_name = "test-response-cache"
+        self.cache = ResponseCache(
+            dynamodb_client=self.mock_dynamodb, table_name=self.table_name
+        )
+
+
+class TestResponseCacheBatchWrite(ResponseCacheTest):
+    """Test bulk inserts into the response cache."""
+
+    def test_cache_responses_batches_of_25(self):
+        """Test that entries are written in BatchWriteItem calls of up to 25."""
+        self.mock_dynamodb.batch_write_item.return_value = {"UnprocessedItems": {}}
+        entries = [(f"prompt {i}", f"response {i}") for i in range(60)]
+
+        written = self.cache.cache_responses(entries)
+
+        assert written == 60
+        batch_sizes = [
+            len(call[1]["RequestItems"][self.table_name])
+            for call in self.mock_dynamodb.batch_write_item.call_args_list
+        ]
+        assert batch_sizes == [25, 25, 10]
+
+        first_item = self.mock_dynamodb.batch_write_item.call_args_list[0][1][
+            "RequestItems"
+        ][self.table_name][0]["PutRequest"]["Item"]
+        assert first_item["prompt_text"]["S"] == "prompt 0"
+        assert first_item["response"]["S"] == "response 0"
+        assert first_item["prompt_hash"]["S"] == self.cache._hash_prompt("prompt 0")
+
+    @patch("eventhandlers.response_cache.time.sleep")
+    def test_cache_responses_retries_unprocessed_items(self, mock_sleep):
+        """Test that unprocessed items are retried until written."""
+        unprocessed = {
+            "PutRequest": {"Item": self.cache._build_item("prompt 1", "r", 0)}
+        }
+        self.mock_dynamodb.batch_write_item.side_effect = [
+            {"UnprocessedItems": {self.table_name: [unprocessed]}},
+            {"UnprocessedItems": {}},
+        ]
+
+        written = self.cache.cache_responses([("prompt 0", "r"), ("prompt 1", "r")])
+
+        assert written == 2
+        assert self.mock_dynamodb.batch_write_item.call_count == 2
+        retry_call = self.mock_dynamodb.batch_write_item.call_args_list[1]
+        assert retry_call[1]["RequestItems"][self.table_name] == [unprocessed]
+
+    def test_cache_responses_merges_duplicate_keys(self):
+        """Test that prompts with the same cache key are written once per batch."""
+        self.mock_dynamodb.batch_write_item.return_value = {"UnprocessedItems": {}}
+
+        written = self.cache.cache_responses(
+            [("What is AWS?", "old"), ("hello", "hi"), ("what is aws", "new")]
+        )
+
+        assert written == 2
+        requests = self.mock_dynamodb.batch_write_item.call_args[1]["RequestItems"][
+            self.table_name
+        ]
+        items = {r["PutRequest"]["Item"]["prompt_hash"]["S"]: r for r in requests}
+        assert len(items) == 2
+        merged = items[self.cache._cache_key("What is AWS?")]["PutRequest"]["Item"]
+        assert merged["prompt_text"]["S"] == "what is aws"
+        assert merged["response"]["S"] == "new"
+
+    def test_cache_responses_handles_errors(self):
+        """Test that a failed batch is reported as not written."""
+        self.mock_dynamodb.batch_write_item.side_effect = Exception("DynamoDB error")
+
+        written = self.cache.cache_responses([("prompt", "response")])
+
+        assert written == 0
+
+
+class TestResponseCacheScan(ResponseCacheTest):
+    """Test scanning the response cache."""
+
+    def _segment_items(self, **kwargs):
+        segment = kwargs.get("Segment", 0)
+        return {
+            "Items": [
+                {
+                    "prompt_hash": {"S": f"hash-{segment}-{i}"},
+                    "prompt_text": {"S": f"prompt {segment}-{i}"},
+                    "response": {"S": "response"},
+                    "ttl": {"N": "0"},
+                }
+                for i in range(kwargs["Limit"])
+            ]
+        }
+
+    def test_scan_cache_single_segment(self):
+        """Test that a single segment scan does not use parallel scan parameters."""
+        self.mock_dynamodb.scan.side_effect = self._segment_items
+
+        entries = self.cache.scan_cache(limit=3)
+
+        assert len(entries) == 3
+        self.mock_dynamodb.scan.assert_called_once_with(
+            TableName=self.table_name,
+            Limit=3,
+            ProjectionExpression="prompt_hash, prompt_text, #r, #t",
+            ExpressionAttributeNames={"#r": "response", "#t": "ttl"},
+        )
+
+    def test_scan_cache_follows_pagination(self):
+        """Test that further pages are read until the limit is reached."""
+        self.mock_dynamodb.scan.side_effect = [
+            {**self._segment_items(Limit=2), "LastEvaluatedKey": {"k": 1}},
+            {**self._segment_items(Limit=2), "LastEvaluatedKey": {"k": 2}},
+        ]
+
+        entries = self.cache.scan_cache(limit=4)
+
+        assert len(entries) == 4
+        second_call = self.mock_dynamodb.scan.call_args_list[1][1]
+        assert second_call["ExclusiveStartKey"] == {"k": 1}
+        assert second_call["Limit"] == 2
+
+    def test_iter_cache_parallel_segments(self):
+        """Test that every segment is scanned and the limit is respected."""
+        self.mock_dynamodb.scan.side_effect = self._segment_items
+
+        entries = list(self.cache.iter_cache(limit=10, segments=4))
+
+        assert len(entries) == 10
+        scanned_segments = sorted(
+            call[1]["Segment"] for call in self.mock_dynamodb.scan.call_args_list
+        )
+        assert scanned_segments == [0, 1, 2, 3]
+        for call in self.mock_dynamodb.scan.call_args_list:
+            assert call[1]["TotalSegments"] == 4
+            assert call[1]["Limit"] <= 3
+
+    def test_iter_cache_sparse_segments(self):
+        """Test that the limit is filled from other segments when some are sparse."""
+
+        def scan(**kwargs):
+            # Only segment 0 has entries, in pages of 4
+            if kwargs["Segment"]:
+                return {"Items": []}
+            return {
+                **self._segment_items(Limit=min(kwargs["Limit"], 4)),
+                "LastEvaluatedKey": {"k": 1},
+            }
+
+        self.mock_dynamodb.scan.side_effect = scan
+
+        entries = list(self.cache.iter_cache(limit=10, segments=4))
+
+        assert len(entries) == 10
+
+    def test_scan_keeps_pages_read_before_an_error(self):
+        """Test that a failed page does not discard the pages read before it."""
+        self.mock_dynamodb.scan.side_effect = [
+            {**self._segment_items(Limit=2), "LastEvaluatedKey": {"k": 1}},
+            Exception("DynamoDB error"),
+        ]
+
+        entries = self.cache.scan_cache(limit=4)
+
+        assert len(entries) == 2
+
+    def test_scan_segment_stops_when_budget_is_taken(self):
+        """Test that no scan is sent once other segments have taken the budget."""
+        budget = ScanBudget(2)
+        budget.take(2)
+
+        items = self.cache._scan_segment(1, 4, budget, page_limit=1)
+
+        assert items == []
+        self.mock_dynamodb.scan.assert_not_called()
+
+
+class TestResponseCacheLookup(ResponseCacheTest):
+    """Test looking up cached responses."""
+
+    def _respond_with(self, *items):
+        self.mock_dynamodb.batch_get_item.return_value = {
+            "Responses": {self.table_name: list(items)}
+        }
+
+    def test_normalized_prompt_hit(self):
+        """Test that case, whitespace and trailing punctuation are ignored."""
+        self._respond_with(self.cache._build_item("What is AWS?", "A cloud.", 0))
+
+        response, prompt_hash = self.cache.get_cached_response("  what   is aws ")
+
+        assert response == "A cloud."
+        assert prompt_hash == self.cache._cache_key("What is AWS?")
+
+    def test_exact_prompt_entry_hit(self):
+        """Test that entries keyed by the exact prompt are still found."""
+        prompt = "What is AWS?"
+        self._respond_with(
+            {
+                "prompt_hash": {"S": self.cache._hash_prompt(prompt)},
+                "prompt_text": {"S": prompt},
+                "response": {"S": "A cloud."},
+            }
+        )
+
+        response, _ = self.cache.get_cached_response(prompt)
+
+        assert response == "A cloud."
+        keys = self.mock_dynamodb.batch_get_item.call_args[1]["RequestItems"][
+            self.table_name
+        ]["Keys"]
+        assert len(keys) == 2
+
+    def test_miss(self):
+        """Test that a prompt without an entry is a miss."""
+        self._respond_with()
+
+        response, prompt_hash = self.cache.get_cached_response("hello")
+
+        assert response is None
+        assert prompt_hash == self.cache._cache_key("hello")
+        request = self.mock_dynamodb.batch_get_item.call_args[1]["RequestItems"][
+            self.table_name
+        ]
+        assert len(request["Keys"]) == 1
+        assert request["ProjectionExpression"] == "prompt_hash, prompt_text, #r"
+
+    def test_repeated_hit_served_from_memory(self):
+        """Test that a prompt found recently is not looked up again."""
+        self._respond_with(self.cache._build_item("What is AWS?", "A cloud.", 0))
+
+        self.cache.get_cached_response("What is AWS?")
+        response, _ = self.cache.get_cached_response("what is aws")
+
+        assert response == "A cloud."
+        self.mock_dynamodb.batch_get_item.assert_called_once()
+
+    @patch("eventhandlers.response_cache.time.monotonic")
+    def test_memory_entry_expires(self, mock_monotonic):
+        """Test that responses kept in memory are looked up again once expired."""
+        mock_monotonic.return_value = 1000.0
+        self.cache.cache_response("hello", "hi")
+        self._respond_with()
+
+        response, _ = self.cache.get_cached_response("hello")
+        assert response == "hi"
+        self.mock_dynamodb.batch_get_item.assert_not_called()
+
+        mock_monotonic.return_value += LOCAL_CACHE_TTL_SECONDS
+        response, _ = self.cache.get_cached_response("hello")
+
+        assert response is None
+        self.mock_dynamodb.batch_get_item.assert_called_once()
+
+
+class TestResponseCacheWrite(ResponseCacheTest):
+    """Test caching a single response."""
+
+    def test_overwrite_is_unconditional(self):
+        """Test that entries are replaced by default."""
+        assert self.cache.cache_response("hello", "hi")
+
+        call_kwargs = self.mock_dynamodb.put_item.call_args[1]
+        assert "ConditionExpression" not in call_kwargs
+
+    def test_skip_existing_keeps_entry(self):
+        """Test that a failed condition keeps the existing entry and succeeds."""
+        self.mock_dynamodb.put_item.side_effect = ClientError(
+            {"Error": {"Code": "ConditionalCheckFailedException"}}, "PutItem"
+        )
+
+        assert self.cache.cache_response("hello", "hi", overwrite=False)
+
+        call_kwargs = self.mock_dynamodb.put_item.call_args[1]
+        assert (
+            call_kwargs["ConditionExpression"]
+            == "attribute_not_exists(prompt_hash) OR #t < :now"
+        )
+        assert not self.cache.local_cache
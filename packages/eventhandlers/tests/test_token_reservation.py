@@ -3,35 +3,76 @@ Tests for the token reservation system to prevent race conditions.
 """
 
 import pytest
-import os
 from unittest.mock import Mock, patch, MagicMock
 from datetime import datetime, timedelta
 
-from eventhandlers.token_meter import (
-    TokenReservationManager,
-    TokenLimiter,
-    create_ten_minute_period,
-    create_monthly_period,
-)
+
+@pytest.fixture(scope="module")
+def token_meter():
+    """
+    The token_meter module, imported on first use rather than at collection,
+    so that runs not selecting these tests do not load boto3.
+    """
+    from eventhandlers import token_meter
+
+    return token_meter
+
+
+def reservation_counter(period_id, tokens):
+    """A reservation counter item, as returned by DynamoDB."""
+    return {"period_id": {"S": period_id}, "output_tokens": {"N": str(tokens)}}
+
+
+def batch_get_response(table_name, *items):
+    """A BatchGetItem response with the items of a table, all processed."""
+    return {"Responses": {table_name: list(items)}, "UnprocessedKeys": {}}
+
+
+class StubDynamoDB:
+    """DynamoDB client stub recording the calls made through it."""
+
+    def __init__(self):
+        self.calls = []
+        self.responses = {}
+        self.errors = {}
+
+    def calls_to(self, operation):
+        """Keyword arguments of each call to an operation, in order."""
+        return [kwargs for name, kwargs in self.calls if name == operation]
+
+    def _call(self, operation, kwargs):
+        self.calls.append((operation, kwargs))
+        if operation in self.errors:
+            raise self.errors[operation]
+        response = self.responses.get(operation, {})
+        # A list holds the responses of successive calls
+        if isinstance(response, list):
+            return response.pop(0)
+        return response
+
+    def update_item(self, **kwargs):
+        return self._call("update_item", kwargs)
+
+    def transact_write_items(self, **kwargs):
+        return self._call("transact_write_items", kwargs)
+
+    def batch_get_item(self, **kwargs):
+        return self._call("batch_get_item", kwargs)
 
 
 class TestTokenReservationManager:
     """Test the TokenReservationManager class."""
 
-    def setup_method(self):
+    @pytest.fixture(autouse=True)
+    def setup(self, token_meter):
         """Set up test fixtures."""
-        # Mock DynamoDB client
-        self.mock_dynamodb = Mock()
+        # Stub DynamoDB client
+        self.dynamodb = StubDynamoDB()
         self.table_name = "test-token-usage"
 
-        # Set environment variables
-        os.environ["TOKEN_USAGE_TABLE"] = self.table_name
-        os.environ["DAILY_OUTPUT_LIMIT"] = "20000"
-        os.environ["RESERVATION_TTL_MINUTES"] = "10"
-
-        # Create reservation manager with mocked client
-        self.reservation_manager = TokenReservationManager(
-            dynamodb_client=self.mock_dynamodb,
+        # Create reservation manager with stubbed client
+        self.reservation_manager = token_meter.TokenReservationManager(
+            dynamodb_client=self.dynamodb,
             table_name=self.table_name,
         )
 
@@ -39,234 +80,429 @@ class TestTokenReservationManager:
         """Test creating a reservation."""
         user_id = "test-user-123"
 
-        # Mock successful put_item
-        self.mock_dynamodb.put_item.return_value = {}
-
         # Create reservation
         reservation_id = self.reservation_manager.create_reservation(user_id)
 
         # Verify reservation was created
         assert reservation_id is not None
-        assert reservation_id.startswith("reservation:daily:")
+        assert reservation_id.startswith("reservation:")
+
+        # Verify the reservation was added to its window counter
+        updates = self.dynamodb.calls_to("update_item")
+        assert len(updates) == 1
+        assert updates[0]["TableName"] == self.table_name
+        assert updates[0]["Key"]["user_id"]["S"] == user_id
+        assert reservation_id.startswith(updates[0]["Key"]["period_id"]["S"])
+        assert updates[0]["ExpressionAttributeValues"][":o"]["N"] == "10000"
+
+    def test_create_reservation_checked(self):
+        """Test that a checked reservation is made only if the counters are unchanged."""
+        user_id = "test-user-123"
+        now = datetime(2025, 1, 8, 10, 5, 30)
+
+        reservation_id = self.reservation_manager.create_reservation(
+            user_id,
+            now,
+            {
+                "reservation:2025-01-08:10:05": 10000,
+                "reservation:2025-01-08:10:04": 5000,
+            },
+        )
 
-        # Verify put_item was called
-        self.mock_dynamodb.put_item.assert_called_once()
-        call_args = self.mock_dynamodb.put_item.call_args
-        assert call_args[1]["TableName"] == self.table_name
-        assert call_args[1]["Item"]["user_id"]["S"] == user_id
-        assert call_args[1]["Item"]["output_tokens"]["N"] == "10000"
+        assert reservation_id.startswith("reservation:2025-01-08:10:05:")
+        assert not self.dynamodb.calls_to("update_item")
+        (transaction,) = self.dynamodb.calls_to("transact_write_items")
+        items = transaction["TransactItems"]
+        update = items[0]["Update"]
+        assert update["ConditionExpression"] == "output_tokens = :expected"
+        assert update["ExpressionAttributeValues"][":expected"]["N"] == "10000"
+        check = items[1]["ConditionCheck"]
+        assert check["Key"]["period_id"]["S"] == "reservation:2025-01-08:10:06"
+        check = items[2]["ConditionCheck"]
+        assert check["Key"]["period_id"]["S"] == "reservation:2025-01-08:10:04"
+        assert check["ConditionExpression"] == "output_tokens = :expected"
+        assert check["ExpressionAttributeValues"][":expected"]["N"] == "5000"
+
+    def test_create_reservation_conflict(self):
+        """Test that no reservation is made if the counters changed."""
+        from botocore.exceptions import ClientError
+
+        self.dynamodb.errors["transact_write_items"] = ClientError(
+            {"Error": {"Code": "TransactionCanceledException"}}, "TransactWriteItems"
+        )
+
+        reservation_id = self.reservation_manager.create_reservation(
+            "test-user-123", reserved={}
+        )
+
+        assert reservation_id is None
+        assert not self.reservation_manager.open_reservations
 
     def test_remove_reservation(self):
         """Test removing a reservation."""
         user_id = "test-user-123"
-        reservation_id = "reservation:daily:2025-01-08:test-uuid"
-
-        # Mock successful delete_item
-        self.mock_dynamodb.delete_item.return_value = {}
+        reservation_id = self.reservation_manager.create_reservation(user_id)
 
         # Remove reservation
         success = self.reservation_manager.remove_reservation(user_id, reservation_id)
         assert success is True
 
-        # Verify delete_item was called
-        self.mock_dynamodb.delete_item.assert_called_once()
-        call_args = self.mock_dynamodb.delete_item.call_args
-        assert call_args[1]["TableName"] == self.table_name
-        assert call_args[1]["Key"]["user_id"]["S"] == user_id
-        assert call_args[1]["Key"]["period_id"]["S"] == reservation_id
+        # Verify the reservation was subtracted from the same counter
+        create, remove = self.dynamodb.calls_to("update_item")
+        assert remove["TableName"] == self.table_name
+        assert remove["Key"]["user_id"]["S"] == user_id
+        assert remove["Key"]["period_id"] == create["Key"]["period_id"]
+        assert remove["ExpressionAttributeValues"][":o"]["N"] == "-10000"
 
-    def test_get_active_reservations(self):
-        """Test getting active reservations."""
+    def test_remove_reservation_once(self):
+        """Test that a reservation removed twice is only subtracted once."""
         user_id = "test-user-123"
+        reservation_id = self.reservation_manager.create_reservation(user_id)
 
-        # Mock query response with reservations
-        mock_response = {
-            "Items": [
-                {
-                    "period_id": {"S": "reservation:daily:2025-01-08:uuid1"},
-                    "output_tokens": {"N": "10000"},
-                    "timestamp": {"N": "1704067200"},
-                },
-                {
-                    "period_id": {"S": "reservation:daily:2025-01-08:uuid2"},
-                    "output_tokens": {"N": "10000"},
-                    "timestamp": {"N": "1704067300"},
-                },
-            ]
-        }
-        self.mock_dynamodb.query.return_value = mock_response
-
-        # Get reservations
-        reservations = self.reservation_manager.get_active_reservations(user_id)
+        assert self.reservation_manager.remove_reservation(user_id, reservation_id)
+        assert self.reservation_manager.remove_reservation(user_id, reservation_id)
+
+        assert len(self.dynamodb.calls_to("update_item")) == 2
+
+    @pytest.mark.parametrize(
+        "counters, expected_total",
+        [
+            ([], 0),
+            ([("reservation:2025-01-08:10:09", 10000)], 10000),
+            (
+                [
+                    ("reservation:2025-01-08:10:09", 10000),
+                    ("reservation:2025-01-08:10:02", 5000),
+                ],
+                15000,
+            ),
+            (
+                [
+                    ("reservation:2025-01-08:10:09", 10000),
+                    ("reservation:2025-01-08:10:02", -10000),
+                ],
+                0,
+            ),
+        ],
+        ids=["none", "one", "two", "removed"],
+    )
+    def test_get_total_reserved_tokens(self, counters, expected_total):
+        """Test getting total reserved tokens."""
+        self.dynamodb.responses["batch_get_item"] = batch_get_response(
+            self.table_name,
+            *(reservation_counter(period_id, tokens) for period_id, tokens in counters),
+        )
 
-        # Verify results
-        assert len(reservations) == 2
-        assert reservations[0]["output_tokens"] == 10000
-        assert reservations[1]["output_tokens"] == 10000
+        # Get total reserved tokens
+        total = self.reservation_manager.get_total_reserved_tokens("test-user-123")
 
-    def test_get_total_reserved_tokens(self):
-        """Test getting total reserved tokens."""
-        user_id = "test-user-123"
+        # Should sum up the counters of the reservation TTL
+        assert total == expected_total
+        (batch_get,) = self.dynamodb.calls_to("batch_get_item")
+        request = batch_get["RequestItems"]
+        assert len(request[self.table_name]["Keys"]) == 10
+        assert request[self.table_name]["ConsistentRead"] is True
 
-        # Mock query response with reservations
-        mock_response = {
-            "Items": [
-                {
-                    "period_id": {"S": "reservation:daily:2025-01-08:uuid1"},
-                    "output_tokens": {"N": "10000"},
-                    "timestamp": {"N": "1704067200"},
-                },
-                {
-                    "period_id": {"S": "reservation:daily:2025-01-08:uuid2"},
-                    "output_tokens": {"N": "5000"},
-                    "timestamp": {"N": "1704067300"},
-                },
-            ]
+    def test_get_reserved_tokens_retries_unprocessed_keys(
+        self, monkeypatch, token_meter
+    ):
+        """Test that unprocessed counters are requested again after a delay."""
+        sleeps = []
+        monkeypatch.setattr(token_meter.time, "sleep", sleeps.append)
+        unprocessed = {self.table_name: {"Keys": [{"period_id": {"S": "b"}}]}}
+        self.dynamodb.responses["batch_get_item"] = [
+            {
+                "Responses": {self.table_name: [reservation_counter("a", 10000)]},
+                "UnprocessedKeys": unprocessed,
+            },
+            batch_get_response(self.table_name, reservation_counter("b", 5000)),
+        ]
+
+        reserved = self.reservation_manager.get_reserved_tokens("test-user-123")
+
+        assert reserved == {"a": 10000, "b": 5000}
+        assert self.dynamodb.calls_to("batch_get_item")[1]["RequestItems"] == (
+            unprocessed
+        )
+        assert len(sleeps) == 1
+
+    def test_get_reserved_tokens_gives_up(self, monkeypatch, token_meter):
+        """Test that counters left unprocessed are not read as a partial total."""
+        monkeypatch.setattr(token_meter.time, "sleep", lambda seconds: None)
+        self.dynamodb.responses["batch_get_item"] = {
+            "Responses": {},
+            "UnprocessedKeys": {self.table_name: {"Keys": []}},
         }
-        self.mock_dynamodb.query.return_value = mock_response
 
-        # Get total reserved tokens
-        total = self.reservation_manager.get_total_reserved_tokens(user_id)
-
-        # Should sum up all reservations
-        assert total == 15000
+        assert self.reservation_manager.get_reserved_tokens("test-user-123") is None
+        assert (
+            len(self.dynamodb.calls_to("batch_get_item"))
+            == token_meter.BATCH_GET_MAX_ATTEMPTS
+        )
 
 
 class TestTokenLimiterWithReservations:
     """Test the TokenLimiter class with reservation functionality."""
 
-    def setup_method(self):
-        """Set up test fixtures."""
-        # Set environment variables
-        os.environ["TOKEN_USAGE_TABLE"] = "test-token-usage"
-        os.environ["DAILY_OUTPUT_LIMIT"] = "20000"
-        os.environ["DAILY_INPUT_LIMIT"] = "10000"
-        os.environ["MONTHLY_OUTPUT_LIMIT"] = "200000"
-        os.environ["MONTHLY_INPUT_LIMIT"] = "100000"
-
-    @patch("eventhandlers.token_meter.TokenReservationManager")
-    @patch("eventhandlers.token_meter.TokenMeter")
-    def test_create_reservation_within_limits(
-        self, mock_token_meter, mock_reservation_manager
-    ):
-        """Test creating a reservation when within limits."""
-        user_id = "test-user-123"
-
-        # Mock the meters to return no limits exceeded
+    @pytest.fixture
+    def meters(self):
+        """Mock daily and monthly meters, reporting no usage."""
         mock_daily_meter = Mock()
         mock_monthly_meter = Mock()
+        mock_daily_meter.name = "10min"
+        mock_monthly_meter.name = "monthly"
+        for meter in (mock_daily_meter, mock_monthly_meter):
+            meter.is_limit_exceeded.return_value = (
+                False,
+                None,
+                {"input_tokens": 0, "output_tokens": 0},
+            )
+        return mock_daily_meter, mock_monthly_meter
+
+    @pytest.fixture
+    def reservation_manager(self, token_meter):
+        """Mock reservation manager of the limiters, with nothing reserved."""
+        with patch.object(
+            token_meter, "TokenReservationManager"
+        ) as mock_reservation_manager:
+            mock_reservation_manager_instance = mock_reservation_manager.return_value
+            mock_reservation_manager_instance.get_reserved_tokens.return_value = {}
+            mock_reservation_manager_instance.create_reservation.return_value = (
+                "reservation:2025-01-08:10:05:test-uuid"
+            )
+            yield mock_reservation_manager_instance
+
+    @pytest.mark.parametrize(
+        "daily_output_tokens, monthly_exceeded, expected_created",
+        [
+            (0, False, True),
+            # 10000 + 0 + 10000 reaches but does not exceed 20000
+            (10000, False, True),
+            # 15000 + 0 + 10000 > 20000
+            (15000, False, False),
+            (0, True, False),
+        ],
+        ids=["no-usage", "reaches-daily-limit", "exceeds-daily-limit", "monthly"],
+    )
+    def test_create_reservation(
+        self,
+        token_meter,
+        meters,
+        reservation_manager,
+        daily_output_tokens,
+        monthly_exceeded,
+        expected_created,
+    ):
+        """Test that a reservation is only created within the limits."""
+        mock_daily_meter, mock_monthly_meter = meters
         mock_daily_meter.is_limit_exceeded.return_value = (
             False,
             None,
-            {"input_tokens": 0, "output_tokens": 0},
-        )
-        mock_monthly_meter.is_limit_exceeded.return_value = (
-            False,
-            None,
-            {"input_tokens": 0, "output_tokens": 0},
-        )
-        mock_daily_meter.name = "10min"
-        mock_monthly_meter.name = "monthly"
-
-        # Mock reservation manager
-        mock_reservation_manager_instance = Mock()
-        mock_reservation_manager_instance.get_total_reserved_tokens.return_value = 0
-        mock_reservation_manager_instance.create_reservation.return_value = (
-            "reservation:daily:2025-01-08:test-uuid"
+            {"input_tokens": 0, "output_tokens": daily_output_tokens},
         )
-        mock_reservation_manager.return_value = mock_reservation_manager_instance
+        if monthly_exceeded:
+            mock_monthly_meter.is_limit_exceeded.return_value = (
+                True,
+                "output",
+                {"input_tokens": 0, "output_tokens": 200000},
+            )
+        token_limiter = token_meter.TokenLimiter(meters=list(meters))
 
-        # Create token limiter with mocked meters
-        token_limiter = TokenLimiter(meters=[mock_daily_meter, mock_monthly_meter])
-
-        # Should be able to create reservation when no usage
-        reservation_id = token_limiter.create_reservation(user_id)
-        assert reservation_id is not None
+        reservation_id = token_limiter.create_reservation("test-user-123")
+        assert (reservation_id is not None) is expected_created
 
-    @patch("eventhandlers.token_meter.TokenReservationManager")
-    @patch("eventhandlers.token_meter.TokenMeter")
-    def test_create_reservation_exceeds_limits(
-        self, mock_token_meter, mock_reservation_manager
+    def test_is_limit_exceeded_with_reservation(
+        self, token_meter, meters, reservation_manager
     ):
-        """Test creating a reservation when it would exceed limits."""
+        """Test limit checking with reservations."""
         user_id = "test-user-123"
+        token_limiter = token_meter.TokenLimiter(meters=list(meters))
 
-        # Mock the meters to return high usage that would exceed limits with reservation
-        mock_daily_meter = Mock()
-        mock_monthly_meter = Mock()
-        mock_daily_meter.is_limit_exceeded.return_value = (
-            False,
-            None,
-            {"input_tokens": 0, "output_tokens": 15000},
+        # Initially should not exceed limits
+        is_exceeded, token_type, period, usage_data = (
+            token_limiter.is_limit_exceeded_with_reservation(user_id)
         )
-        mock_monthly_meter.is_limit_exceeded.return_value = (
-            False,
-            None,
-            {"input_tokens": 0, "output_tokens": 15000},
+        assert is_exceeded is False
+
+        # Now simulate existing reservations that would cause limit to be exceeded
+        reservation_manager.get_reserved_tokens.return_value = {
+            "reservation:2025-01-08:10:00": 15000
+        }
+
+        # Should now exceed limits (0 + 15000 + 10000 > 20000)
+        is_exceeded, token_type, period, usage_data = (
+            token_limiter.is_limit_exceeded_with_reservation(user_id)
         )
-        mock_daily_meter.name = "10min"
-        mock_monthly_meter.name = "monthly"
+        assert is_exceeded is True
+        assert token_type == "output"
+        assert period == "daily"
+
+    def test_create_reservation_with_usage_data(
+        self, token_meter, meters, reservation_manager
+    ):
+        """Test that usage data passed in is used instead of reading the meters."""
+        user_id = "test-user-123"
+        mock_daily_meter = meters[0]
 
-        # Mock reservation manager
-        mock_reservation_manager_instance = Mock()
-        mock_reservation_manager_instance.get_total_reserved_tokens.return_value = 0
-        mock_reservation_manager.return_value = mock_reservation_manager_instance
+        token_limiter = token_meter.TokenLimiter(meters=[mock_daily_meter])
+        usage_data = {"daily_output_tokens": 5000}
 
-        # Create token limiter with mocked meters
-        token_limiter = TokenLimiter(meters=[mock_daily_meter, mock_monthly_meter])
+        reservation_id = token_limiter.create_reservation(user_id, usage_data)
+        assert reservation_id is not None
+        mock_daily_meter.is_limit_exceeded.assert_not_called()
+        assert usage_data == {"daily_output_tokens": 5000}
 
-        # Should not be able to create reservation (15000 + 0 + 10000 > 20000)
-        reservation_id = token_limiter.create_reservation(user_id)
+        # 15000 + 0 + 10000 > 20000
+        reservation_id = token_limiter.create_reservation(
+            user_id, {"daily_output_tokens": 15000}
+        )
         assert reservation_id is None
 
-    @patch("eventhandlers.token_meter.TokenReservationManager")
-    @patch("eventhandlers.token_meter.TokenMeter")
-    def test_is_limit_exceeded_with_reservation(
-        self, mock_token_meter, mock_reservation_manager
+    def test_create_reservation_rechecked_after_conflict(
+        self, token_meter, reservation_manager
     ):
-        """Test limit checking with reservations."""
-        user_id = "test-user-123"
+        """Test that the check is repeated when another reservation got in first."""
+        reservation_manager.create_reservation.side_effect = [
+            None,
+            "reservation:2025-01-08:10:05:test-uuid",
+        ]
 
-        # Mock the meters to return no limits exceeded initially
-        mock_daily_meter = Mock()
-        mock_monthly_meter = Mock()
+        token_limiter = token_meter.TokenLimiter(meters=[])
+        reservation_id = token_limiter.create_reservation(
+            "user", {"daily_output_tokens": 0}
+        )
+
+        assert reservation_id == "reservation:2025-01-08:10:05:test-uuid"
+        assert reservation_manager.get_reserved_tokens.call_count == 2
+
+    def test_usage_data_by_period(self, token_meter, meters, reservation_manager):
+        """Test that usage is reported per period, with the daily usage as total."""
+        mock_daily_meter, mock_monthly_meter = meters
         mock_daily_meter.is_limit_exceeded.return_value = (
             False,
             None,
-            {"input_tokens": 0, "output_tokens": 0},
+            {"input_tokens": 100, "output_tokens": 200},
         )
         mock_monthly_meter.is_limit_exceeded.return_value = (
             False,
             None,
-            {"input_tokens": 0, "output_tokens": 0},
+            {"input_tokens": 500, "output_tokens": 900},
         )
-        mock_daily_meter.name = "10min"
-        mock_monthly_meter.name = "monthly"
 
-        # Mock reservation manager
-        mock_reservation_manager_instance = Mock()
-        mock_reservation_manager_instance.get_total_reserved_tokens.return_value = 0
-        mock_reservation_manager.return_value = mock_reservation_manager_instance
+        token_limiter = token_meter.TokenLimiter(meters=list(meters))
+        is_exceeded, _, _, usage_data = token_limiter.is_limit_exceeded("user")
+
+        assert not is_exceeded
+        assert usage_data == {
+            "input_tokens": 100,
+            "output_tokens": 200,
+            "daily_input_tokens": 100,
+            "daily_output_tokens": 200,
+            "monthly_input_tokens": 500,
+            "monthly_output_tokens": 900,
+        }
 
-        # Create token limiter with mocked meters
-        token_limiter = TokenLimiter(meters=[mock_daily_meter, mock_monthly_meter])
 
-        # Initially should not exceed limits
-        is_exceeded, token_type, period, usage_data = (
-            token_limiter.is_limit_exceeded_with_reservation(user_id)
+class TestTokenMeterUsageCache:
+    """Test the in-memory cache of usage read by a TokenMeter."""
+
+    @pytest.fixture(autouse=True)
+    def setup(self, token_meter):
+        """Set up test fixtures."""
+        # Only the operations a meter uses, so any other call fails
+        self.mock_dynamodb = Mock(spec_set=["get_item", "query", "update_item"])
+        self.mock_dynamodb.get_item.return_value = {
+            "Item": {"input_tokens": {"N": "100"}, "output_tokens": {"N": "200"}}
+        }
+        self.meter = token_meter.TokenMeter(
+            token_meter.create_monthly_period(),
+            dynamodb_client=self.mock_dynamodb,
+            table_name="test-token-usage",
         )
-        assert is_exceeded is False
 
-        # Now simulate existing reservations that would cause limit to be exceeded
-        mock_reservation_manager_instance.get_total_reserved_tokens.return_value = 15000
+    def test_usage_read_once(self):
+        """Test that usage read recently is not read from DynamoDB again."""
+        assert self.meter.is_limit_exceeded("user")[2] == {
+            "input_tokens": 100,
+            "output_tokens": 200,
+        }
+        assert self.meter.is_limit_exceeded("user")[2] == {
+            "input_tokens": 100,
+            "output_tokens": 200,
+        }
+        self.mock_dynamodb.get_item.assert_called_once()
+        call_args = self.mock_dynamodb.get_item.call_args[1]
+        assert call_args["ConsistentRead"] is False
+        assert call_args["ProjectionExpression"] == "input_tokens, output_tokens"
+
+    def test_update_refreshes_cached_usage(self):
+        """Test that the counters returned by an update replace the cached usage."""
+        self.mock_dynamodb.update_item.return_value = {
+            "Attributes": {"input_tokens": {"N": "150"}, "output_tokens": {"N": "250"}}
+        }
 
-        # Should now exceed limits (0 + 15000 + 10000 > 20000)
-        is_exceeded, token_type, period, usage_data = (
-            token_limiter.is_limit_exceeded_with_reservation(user_id)
+        assert self.meter.update_usage("user", 10, 20)
+
+        assert self.meter.is_limit_exceeded("user")[2] == {
+            "input_tokens": 150,
+            "output_tokens": 250,
+        }
+        self.mock_dynamodb.get_item.assert_not_called()
+        call_args = self.mock_dynamodb.update_item.call_args[1]
+        assert call_args["ReturnValues"] == "UPDATED_NEW"
+
+    def test_update_adds_to_cached_aggregate_usage(self, token_meter):
+        """Test that recorded usage is added to cached aggregated usage."""
+        self.mock_dynamodb.query.return_value = {
+            "Items": [{"input_tokens": {"N": "100"}, "output_tokens": {"N": "200"}}]
+        }
+        meter = token_meter.TokenMeter(
+            token_meter.create_ten_minute_period(),
+            dynamodb_client=self.mock_dynamodb,
+            table_name="test-token-usage",
         )
-        assert is_exceeded is True
-        assert token_type == "output"
-        assert period == "daily"
+        meter.is_limit_exceeded("user")
+
+        assert meter.update_usage("user", 10, 20)
+
+        assert meter.is_limit_exceeded("user")[2] == {
+            "input_tokens": 110,
+            "output_tokens": 220,
+        }
+        self.mock_dynamodb.query.assert_called_once()
+
+    def test_retried_update_counted_once(self):
+        """Test that an update already applied under its request ID succeeds."""
+        from botocore.exceptions import ClientError
+
+        self.meter.is_limit_exceeded("user")
+        self.mock_dynamodb.update_item.side_effect = ClientError(
+            {"Error": {"Code": "ConditionalCheckFailedException"}}, "UpdateItem"
+        )
+
+        assert self.meter.update_usage("user", 10, 20, "request-1")
+
+        call_args = self.mock_dynamodb.update_item.call_args[1]
+        assert call_args["ExpressionAttributeValues"][":rid"] == {"S": "request-1"}
+        assert "last_request_id <> :rid" in call_args["ConditionExpression"]
+        assert not self.meter.usage_cache
+
+    def test_read_error_not_cached(self):
+        """Test that a failed read is retried on the next check."""
+        self.mock_dynamodb.get_item.side_effect = [Exception("throttled"), {}]
+
+        self.meter.is_limit_exceeded("user")
+        self.meter.is_limit_exceeded("user")
+
+        assert self.mock_dynamodb.get_item.call_count == 2
+
+    def test_update_error_without_response(self):
+        """Test that an error whose response is None fails the update."""
+        from requests.exceptions import ConnectionError
+
+        self.mock_dynamodb.update_item.side_effect = ConnectionError("reset")
+
+        assert self.meter.update_usage("user", 10, 20) is False
 
 
 if __name__ == "__main__":